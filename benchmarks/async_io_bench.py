@@ -0,0 +1,54 @@
+import os
+import asyncio
+import shutil
+import argparse
+import tempfile
+import time
+
+from corpus import generate_corpus, repo_dir
+from latency_fs import LatencyFilesystem
+
+import convertV3
+
+def run_mode(mode, corpus_path, pipeline, args):
+  if mode == 'async':
+    return asyncio.run(convertV3.process_files_async(corpus_path, [], [], pipeline, args.jobs, io_concurrency=args.io_concurrency))
+  return convertV3.process_files_in_parallel(corpus_path, [], [], pipeline, args.jobs)
+
+def main():
+  parser = argparse.ArgumentParser(description="Benchmark the thread pool and --async-io paths of convertV3 on a filesystem with injected latency")
+  parser.add_argument('--files', type=int, default=500, help="Number of playbooks to generate")
+  parser.add_argument('--tasks', type=int, default=10, help="Number of tasks per playbook")
+  parser.add_argument('--latency-ms', nargs='*', type=float, default=[0, 1, 5], help="Latency added to every filesystem round trip")
+  parser.add_argument('--jobs', type=int, default=None, help="Workers of the thread pool, and of the transform pool in async mode")
+  parser.add_argument('--io-concurrency', type=int, default=32, help="Calls in flight at once in async mode")
+  args = parser.parse_args()
+
+  pipeline = convertV3.RulePipeline(convertV3.load_fqcn_mapping(os.path.join(repo_dir, 'fqcn_mapping.txt')))
+  template_path = tempfile.mkdtemp(prefix='modernizr-corpus-')
+  try:
+    generate_corpus(template_path, args.files, args.tasks)
+    print(f"{'latency ms':>10} {'mode':<8} {'seconds':>8} {'files/sec':>10} {'fs calls':>9} {'concurrent':>11} {'speedup':>8}")
+    for latency_ms in args.latency_ms:
+      baseline = None
+      for mode in ('thread', 'async'):
+        # Every run converts a fresh copy of the corpus, the copy is not timed
+        run_path = tempfile.mkdtemp(prefix='modernizr-bench-')
+        try:
+          corpus_path = os.path.join(run_path, 'corpus')
+          shutil.copytree(template_path, corpus_path)
+          with LatencyFilesystem(latency_ms / 1000) as filesystem:
+            start = time.perf_counter()
+            counts = run_mode(mode, corpus_path, pipeline, args)
+            elapsed = time.perf_counter() - start
+        finally:
+          shutil.rmtree(run_path)
+        if counts['changed'] != args.files:
+          raise SystemExit(f"{mode} converted {counts['changed']} of {args.files} files")
+        baseline = baseline or elapsed
+        print(f"{latency_ms:>10.1f} {mode:<8} {elapsed:>8.2f} {args.files / elapsed:>10.1f} {filesystem.calls:>9} {filesystem.max_concurrent:>11} {baseline / elapsed:>7.1f}x")
+  finally:
+    shutil.rmtree(template_path)
+
+if __name__ == "__main__":
+  main()
@@ -0,0 +1,92 @@
+import os
+import sys
+import random
+import argparse
+
+# Add the repository root to the sys.path so the converters can be imported
+repo_dir = os.path.abspath(os.path.join(os.path.dirname(__file__), '../'))
+sys.path.append(repo_dir)
+
+import convertV3  # noqa: E402
+
+# Argument lines for the generated tasks, keyed on how much Jinja they carry
+plain_arguments = [
+  'path: /etc/app/config',
+  'state: present',
+  'name: nginx',
+  'mode: "0644"',
+  'enabled: true',
+  'url: https://example.com/repo#main',
+]
+jinja_arguments = [
+  'msg: "{{item}}"',
+  'dest: "{{app_root}}/{{app_name}}.conf"',
+  'when: "{{result|bool}}"',
+  'name: "{{(packages|default([]))|join(\',\')}}"',
+  'src: "{{role_path}}/files/{{inventory_hostname|lower}}"',
+]
+task_names = ['install packages', 'configure service', 'render template', 'check status', 'restart daemon', 'create user']
+comments = ['#todo tidy this up', '#managed by ansible', '#see docs#section']
+
+def generate_task(rng, modules, jinja_density):
+  lines = []
+  if rng.random() < 0.2:
+    lines.append(f'    {rng.choice(comments)}')
+  lines.append(f'    - name: {rng.choice(task_names)}')
+  lines.append(f'      {rng.choice(modules)}:')
+  keys = set()
+  for _ in range(rng.randint(1, 4)):
+    arguments = jinja_arguments if rng.random() < jinja_density else plain_arguments
+    argument = rng.choice(arguments)
+    # Keep the generated YAML valid by never repeating a key
+    if argument.split(':')[0] not in keys:
+      keys.add(argument.split(':')[0])
+      lines.append(f'        {argument}')
+  if rng.random() < 0.3:
+    lines.append('')
+    lines.append('')
+  return lines
+
+def generate_playbook(rng, modules, tasks, jinja_density):
+  lines = ['- name: generated play', '  hosts: all', '  tasks:']
+  for _ in range(tasks):
+    lines.extend(generate_task(rng, modules, jinja_density))
+  return '\n'.join(lines) + '\n'
+
+def generate_corpus(directory_path, files=100, tasks=20, jinja_density=0.3, module_count=None, mapping_file=None, seed=0):
+  # Writes a role/playbook tree of unconverted playbooks and returns the paths.
+  # Modules are drawn from the first module_count entries of the mapping file
+  # so the FQCN rules always have something to do.
+  rng = random.Random(seed)
+  fqcn_mapping = convertV3.load_fqcn_mapping(mapping_file or os.path.join(repo_dir, 'fqcn_mapping.txt'))
+  modules = sorted(fqcn_mapping)[:module_count] if module_count else sorted(fqcn_mapping)
+
+  file_paths = []
+  for index in range(files):
+    # Every tenth file is a top level playbook, the rest live in roles of 50 files
+    if index % 10 == 0:
+      file_path = os.path.join(directory_path, 'playbooks', f'site_{index}.yml')
+    else:
+      file_path = os.path.join(directory_path, 'roles', f'role_{index // 50}', 'tasks', f'task_{index}.yml')
+    os.makedirs(os.path.dirname(file_path), exist_ok=True)
+    with open(file_path, 'w') as file:
+      file.write(generate_playbook(rng, modules, tasks, jinja_density))
+    file_paths.append(file_path)
+  return file_paths
+
+def main():
+  parser = argparse.ArgumentParser(description="Generate a synthetic, unconverted Ansible corpus")
+  parser.add_argument('--path', required=True, help="Directory to generate the corpus in")
+  parser.add_argument('--files', type=int, default=100, help="Number of playbooks to generate")
+  parser.add_argument('--tasks', type=int, default=20, help="Number of tasks per playbook")
+  parser.add_argument('--jinja-density', type=float, default=0.3, help="Share of task arguments that contain Jinja")
+  parser.add_argument('--module-count', type=int, default=None, help="Only use this many modules from the mapping file")
+  parser.add_argument('--mapping-file', default=None, help="Mapping file to draw modules from, defaults to fqcn_mapping.txt")
+  parser.add_argument('--seed', type=int, default=0, help="Random seed, the same seed always produces the same corpus")
+  args = parser.parse_args()
+
+  file_paths = generate_corpus(args.path, args.files, args.tasks, args.jinja_density, args.module_count, args.mapping_file, args.seed)
+  print(f"Generated {len(file_paths)} playbooks in {args.path}")
+
+if __name__ == "__main__":
+  main()
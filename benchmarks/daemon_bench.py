@@ -0,0 +1,91 @@
+import os
+import sys
+import json
+import shutil
+import argparse
+import tempfile
+import statistics
+import subprocess
+import time
+
+from corpus import generate_corpus, repo_dir
+
+import convertV3
+
+converter = os.path.join(repo_dir, 'convertV3.py')
+
+def percentile(timings, share):
+  timings = sorted(timings)
+  return timings[min(len(timings) - 1, int(len(timings) * share))]
+
+def cold_cli(file_paths, mapping_file, engine):
+  # What a pre-commit hook or editor save does today: one converter process
+  # per file, each with its own directory so only that file is converted
+  timings = []
+  for file_path in file_paths:
+    start = time.perf_counter()
+    subprocess.run([sys.executable, converter, '--path', os.path.dirname(file_path), '--mapping-file', mapping_file, '--engine', engine], cwd=os.path.dirname(file_path), check=True, stdout=subprocess.DEVNULL)
+    timings.append(time.perf_counter() - start)
+  return timings
+
+def warm_daemon(file_paths, mapping_file, engine, method):
+  # One serve process for all files, only the request round trip is timed
+  process = subprocess.Popen([sys.executable, converter, 'serve', '--mapping-file', mapping_file, '--engine', engine], cwd=os.path.dirname(file_paths[0]), stdin=subprocess.PIPE, stdout=subprocess.PIPE, text=True)
+  timings = []
+  try:
+    # Startup is paid once per session, so it is kept out of the timings
+    process.stdin.write(json.dumps({'jsonrpc': '2.0', 'id': 'ready', 'method': 'convert', 'params': {'text': ''}}) + '\n')
+    process.stdin.flush()
+    process.stdout.readline()
+    for request_id, file_path in enumerate(file_paths):
+      if method == 'convert':
+        with open(file_path, 'r') as file:
+          params = {'text': file.read()}
+      else:
+        params = {'path': file_path}
+      start = time.perf_counter()
+      process.stdin.write(json.dumps({'jsonrpc': '2.0', 'id': request_id, 'method': method, 'params': params}) + '\n')
+      process.stdin.flush()
+      response = json.loads(process.stdout.readline())
+      timings.append(time.perf_counter() - start)
+      if 'error' in response:
+        sys.exit(f"{method} failed: {response['error']['message']}")
+  finally:
+    process.stdin.close()
+    process.wait()
+  return timings
+
+def main():
+  parser = argparse.ArgumentParser(description="Benchmark per file latency of a cold convertV3 run against a warm serve process")
+  parser.add_argument('--files', type=int, default=50, help="Number of playbooks to convert one at a time")
+  parser.add_argument('--tasks', type=int, default=20, help="Number of tasks per playbook")
+  parser.add_argument('--engine', choices=sorted(convertV3.pipelines), default='regex', help="Engine to run")
+  parser.add_argument('--mapping-file', default=os.path.join(repo_dir, 'fqcn_mapping.txt'), help="Mapping file or compiled index to load")
+  args = parser.parse_args()
+
+  template_path = tempfile.mkdtemp(prefix='modernizr-corpus-')
+  try:
+    generated = generate_corpus(template_path, args.files, args.tasks)
+    print(f"{'mode':<14} {'files':>6} {'median ms':>10} {'p95 ms':>8} {'max ms':>8}")
+    for mode in ('cold-cli', 'warm-file', 'warm-buffer'):
+      # Every mode converts fresh copies, each playbook in a directory of its own
+      run_path = tempfile.mkdtemp(prefix='modernizr-bench-')
+      try:
+        file_paths = []
+        for index, source_path in enumerate(generated):
+          file_path = os.path.join(run_path, str(index), os.path.basename(source_path))
+          os.makedirs(os.path.dirname(file_path))
+          shutil.copyfile(source_path, file_path)
+          file_paths.append(file_path)
+        if mode == 'cold-cli':
+          timings = cold_cli(file_paths, args.mapping_file, args.engine)
+        else:
+          timings = warm_daemon(file_paths, args.mapping_file, args.engine, 'convert_file' if mode == 'warm-file' else 'convert')
+      finally:
+        shutil.rmtree(run_path)
+      print(f"{mode:<14} {len(timings):>6} {statistics.median(timings) * 1000:>10.2f} {percentile(timings, 0.95) * 1000:>8.2f} {max(timings) * 1000:>8.2f}")
+  finally:
+    shutil.rmtree(template_path)
+
+if __name__ == "__main__":
+  main()
@@ -0,0 +1,108 @@
+import os
+import sys
+import json
+import shutil
+import argparse
+import tempfile
+import itertools
+import subprocess
+import time
+
+from corpus import generate_corpus, repo_dir
+
+mapping_file = os.path.join(repo_dir, 'fqcn_mapping.txt')
+
+# Command line of every engine for a corpus in <run directory>/testing, which is
+# where convert.py looks as it takes no arguments
+engines = {
+  'convert': lambda corpus_path: [sys.executable, os.path.join(repo_dir, 'convert.py')],
+  'convertV2': lambda corpus_path: [sys.executable, os.path.join(repo_dir, 'convertV2.py'), '--path', corpus_path],
+  'convertV3': lambda corpus_path: [sys.executable, os.path.join(repo_dir, 'convertV3.py'), '--path', corpus_path, '--mapping-file', mapping_file],
+  'convertV3-process': lambda corpus_path: [sys.executable, os.path.join(repo_dir, 'convertV3.py'), '--path', corpus_path, '--mapping-file', mapping_file, '--executor', 'process'],
+  'convertV3-structure': lambda corpus_path: [sys.executable, os.path.join(repo_dir, 'convertV3.py'), '--path', corpus_path, '--mapping-file', mapping_file, '--engine', 'structure'],
+}
+
+def peak_rss_mb(rusage):
+  # ru_maxrss is in kilobytes on Linux and in bytes on macOS
+  return rusage.ru_maxrss / (1024 * 1024 if sys.platform == 'darwin' else 1024)
+
+def run_engine(engine, template_path):
+  # Every run converts a fresh copy of the corpus, the copy is not timed
+  run_path = tempfile.mkdtemp(prefix='modernizr-bench-')
+  try:
+    corpus_path = os.path.join(run_path, 'testing')
+    shutil.copytree(template_path, corpus_path)
+    start = time.perf_counter()
+    process = subprocess.Popen(engines[engine](corpus_path), cwd=run_path, stdout=subprocess.DEVNULL)
+    _, status, rusage = os.wait4(process.pid, 0)
+    elapsed = time.perf_counter() - start
+    process.returncode = os.waitstatus_to_exitcode(status)
+    if process.returncode:
+      sys.exit(f"{engine} exited with status {process.returncode}")
+    return elapsed, peak_rss_mb(rusage)
+  finally:
+    shutil.rmtree(run_path)
+
+def corpus_size_mb(directory_path):
+  total = 0
+  for root, _, files in os.walk(directory_path):
+    total += sum(os.path.getsize(os.path.join(root, file_name)) for file_name in files)
+  return total / (1024 * 1024)
+
+def compare(results, baseline_file, tolerance):
+  # Returns the scenarios whose throughput dropped by more than tolerance
+  with open(baseline_file, 'r') as file:
+    baseline = {(result['engine'], result['files'], result['tasks'], result['jinja_density']): result for result in json.load(file)}
+  regressions = []
+  for result in results:
+    previous = baseline.get((result['engine'], result['files'], result['tasks'], result['jinja_density']))
+    if previous and result['files_per_sec'] < previous['files_per_sec'] * (1 - tolerance):
+      regressions.append(f"{result['engine']} files={result['files']} tasks={result['tasks']} jinja={result['jinja_density']}: {previous['files_per_sec']:.1f} -> {result['files_per_sec']:.1f} files/sec")
+  return regressions
+
+def main():
+  parser = argparse.ArgumentParser(description="Benchmark throughput and peak RSS of every converter on synthetic corpora")
+  parser.add_argument('--engines', nargs='*', choices=list(engines), default=list(engines), help="Engines to benchmark")
+  parser.add_argument('--files', nargs='*', type=int, default=[200], help="Playbook counts to benchmark")
+  parser.add_argument('--tasks', nargs='*', type=int, default=[20, 200], help="Tasks per playbook to benchmark, controls the file size")
+  parser.add_argument('--jinja-density', nargs='*', type=float, default=[0.1, 0.8], help="Share of task arguments that contain Jinja")
+  parser.add_argument('--module-count', type=int, default=None, help="Only use this many modules from the mapping file")
+  parser.add_argument('--repeat', type=int, default=3, help="Number of runs per scenario, the fastest one is reported")
+  parser.add_argument('--json', default=None, metavar='FILE', help="Write the results as JSON to FILE")
+  parser.add_argument('--baseline', default=None, metavar='FILE', help="JSON results of an earlier run to compare against")
+  parser.add_argument('--tolerance', type=float, default=0.2, help="Allowed throughput drop against the baseline before failing")
+  args = parser.parse_args()
+
+  results = []
+  print(f"{'engine':<18} {'files':>6} {'tasks':>6} {'jinja':>6} {'MB':>7} {'seconds':>8} {'files/sec':>10} {'MB/sec':>8} {'peak RSS MB':>12}")
+  for files, tasks, jinja_density in itertools.product(args.files, args.tasks, args.jinja_density):
+    template_path = tempfile.mkdtemp(prefix='modernizr-corpus-')
+    try:
+      generate_corpus(template_path, files, tasks, jinja_density, args.module_count)
+      size_mb = corpus_size_mb(template_path)
+      for engine in args.engines:
+        runs = [run_engine(engine, template_path) for _ in range(args.repeat)]
+        elapsed = min(run[0] for run in runs)
+        peak_rss = max(run[1] for run in runs)
+        result = {
+          'engine': engine, 'files': files, 'tasks': tasks, 'jinja_density': jinja_density, 'size_mb': size_mb,
+          'seconds': elapsed, 'files_per_sec': files / elapsed, 'mb_per_sec': size_mb / elapsed, 'peak_rss_mb': peak_rss,
+        }
+        results.append(result)
+        print(f"{engine:<18} {files:>6} {tasks:>6} {jinja_density:>6.2f} {size_mb:>7.2f} {elapsed:>8.2f} {result['files_per_sec']:>10.1f} {result['mb_per_sec']:>8.2f} {peak_rss:>12.1f}")
+    finally:
+      shutil.rmtree(template_path)
+
+  if args.json:
+    with open(args.json, 'w') as file:
+      json.dump(results, file, indent=2)
+
+  if args.baseline:
+    regressions = compare(results, args.baseline, args.tolerance)
+    for regression in regressions:
+      print(f"Regression: {regression}", file=sys.stderr)
+    if regressions:
+      sys.exit(1)
+
+if __name__ == "__main__":
+  main()
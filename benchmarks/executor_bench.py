@@ -0,0 +1,37 @@
+import os
+import shutil
+import argparse
+import tempfile
+import time
+
+from corpus import generate_corpus, repo_dir
+
+import convertV3
+
+def main():
+  parser = argparse.ArgumentParser(description="Benchmark convertV3 throughput per executor and worker count")
+  parser.add_argument('--files', type=int, default=2000, help="Number of playbooks to generate")
+  parser.add_argument('--tasks', type=int, default=100, help="Number of tasks per playbook")
+  parser.add_argument('--workers', nargs='*', type=int, default=[1, 4, 16, 64], help="Worker counts to benchmark")
+  parser.add_argument('--executors', nargs='*', choices=sorted(convertV3.executors), default=sorted(convertV3.executors), help="Executors to benchmark")
+  parser.add_argument('--batch-size', type=int, default=32, help="Number of files handed to a worker at a time")
+  args = parser.parse_args()
+
+  pipeline = convertV3.RulePipeline(convertV3.load_fqcn_mapping(os.path.join(repo_dir, 'fqcn_mapping.txt')))
+
+  print(f"{'executor':>9} {'workers':>8} {'seconds':>9} {'files/sec':>10}")
+  for executor_type in args.executors:
+    for jobs in args.workers:
+      # Every run starts from an unconverted tree so each one does the same work
+      directory_path = tempfile.mkdtemp(prefix='modernizr-bench-')
+      try:
+        generate_corpus(directory_path, args.files, args.tasks)
+        start = time.perf_counter()
+        convertV3.process_files_in_parallel(directory_path, [], [], pipeline, jobs, executor_type, args.batch_size)
+        elapsed = time.perf_counter() - start
+      finally:
+        shutil.rmtree(directory_path)
+      print(f"{executor_type:>9} {jobs:>8} {elapsed:>9.2f} {args.files / elapsed:>10.1f}")
+
+if __name__ == "__main__":
+  main()
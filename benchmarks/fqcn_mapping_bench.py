@@ -0,0 +1,51 @@
+import os
+import re
+import sys
+import argparse
+import timeit
+
+# Add the repository root to the sys.path so the converters can be imported
+repo_dir = os.path.abspath(os.path.join(os.path.dirname(__file__), '../'))
+sys.path.append(repo_dir)
+
+import convertV3  # noqa: E402
+
+def build_mapping(size):
+  # Start from the shipped mapping and pad it with synthetic collection modules
+  fqcn_mapping = convertV3.load_fqcn_mapping(os.path.join(repo_dir, 'fqcn_mapping.txt'))
+  index = 0
+  while len(fqcn_mapping) < size:
+    fqcn_mapping[f'synthetic_module_{index}'] = 'community.general'
+    index += 1
+  return fqcn_mapping
+
+def legacy_replace(file_contents, fqcn_mapping):
+  # The previous implementation, one re.sub per mapping entry
+  for module_name, fqcn_prefix in fqcn_mapping.items():
+    pattern = fr'\s({re.escape(module_name)}:)'
+    replacement = f' {fqcn_prefix}.\\g<1>'
+    file_contents = re.sub(pattern, replacement, file_contents)
+  return file_contents
+
+def main():
+  parser = argparse.ArgumentParser(description="Benchmark FQCN rewriting against the mapping size")
+  parser.add_argument('--sizes', nargs='*', type=int, default=[80, 500, 1000, 2500, 5000], help="Mapping sizes to benchmark")
+  parser.add_argument('--copies', type=int, default=50, help="Number of copies of tests/test.yml per document")
+  parser.add_argument('--repeat', type=int, default=5, help="Number of timed runs per size")
+  args = parser.parse_args()
+
+  with open(os.path.join(repo_dir, 'tests', 'test.yml'), 'r') as file:
+    file_contents = file.read() * args.copies
+
+  print(f"{'entries':>8} {'legacy ms':>12} {'single pass ms':>16} {'speedup':>9}")
+  for size in args.sizes:
+    fqcn_mapping = build_mapping(size)
+    # Both engines must produce the same output before timing means anything
+    if legacy_replace(file_contents, fqcn_mapping) != convertV3.replace_fqcn_modules(file_contents, fqcn_mapping):
+      sys.exit(f"Output mismatch with {size} mapping entries")
+    legacy = min(timeit.repeat(lambda: legacy_replace(file_contents, fqcn_mapping), number=1, repeat=args.repeat))
+    single = min(timeit.repeat(lambda: convertV3.replace_fqcn_modules(file_contents, fqcn_mapping), number=1, repeat=args.repeat))
+    print(f"{size:>8} {legacy * 1000:>12.2f} {single * 1000:>16.2f} {legacy / single:>8.1f}x")
+
+if __name__ == "__main__":
+  main()
@@ -0,0 +1,45 @@
+import os
+import time
+import builtins
+import threading
+
+class LatencyFilesystem:
+  # Stand-in for an NFS share on the local disk: while active, every call
+  # that would be a round trip to the server (open, stat, scandir and
+  # rename) first sleeps for latency seconds. The sleep releases the GIL
+  # just as waiting on the network does. The highest number of calls
+  # waiting at once is kept in max_concurrent.
+  patched = [(builtins, 'open'), (os, 'open'), (os, 'stat'), (os, 'scandir'), (os, 'replace')]
+
+  def __init__(self, latency):
+    self.latency = latency
+    self.lock = threading.Lock()
+    self.calls = 0
+    self.waiting = 0
+    self.max_concurrent = 0
+    self.originals = {}
+
+  def wrap(self, function):
+    def slow(*args, **kwargs):
+      with self.lock:
+        self.calls += 1
+        self.waiting += 1
+        self.max_concurrent = max(self.max_concurrent, self.waiting)
+      try:
+        time.sleep(self.latency)
+      finally:
+        with self.lock:
+          self.waiting -= 1
+      return function(*args, **kwargs)
+    return slow
+
+  def __enter__(self):
+    for module, name in self.patched:
+      self.originals[(module, name)] = getattr(module, name)
+      setattr(module, name, self.wrap(getattr(module, name)))
+    return self
+
+  def __exit__(self, *exc_info):
+    for (module, name), function in self.originals.items():
+      setattr(module, name, function)
+    self.originals.clear()
@@ -0,0 +1,53 @@
+import os
+import argparse
+import tempfile
+import shutil
+import timeit
+
+from corpus import generate_corpus, repo_dir
+
+import convertV3
+
+def main():
+  # The regex engine, RulePipeline, is the baseline: any other engine slower
+  # than it on a corpus is reported as missing it. regex-unfiltered shows what
+  # the prefilter is worth.
+  parser = argparse.ArgumentParser(description="Benchmark the in-memory transform of every convertV3 engine against the regex engine")
+  parser.add_argument('--files', type=int, default=200, help="Number of playbooks to generate")
+  parser.add_argument('--tasks', type=int, default=50, help="Number of tasks per playbook")
+  parser.add_argument('--jinja-density', nargs='*', type=float, default=[0.0, 0.1, 0.5, 0.9], help="Share of task arguments that contain Jinja")
+  parser.add_argument('--repeat', type=int, default=3, help="Number of timed runs, the fastest one is reported")
+  args = parser.parse_args()
+
+  fqcn_mapping = convertV3.load_fqcn_mapping(os.path.join(repo_dir, 'fqcn_mapping.txt'))
+  engines = {engine: pipeline_class(fqcn_mapping).apply for engine, pipeline_class in sorted(convertV3.pipelines.items())}
+  engines['regex-unfiltered'] = convertV3.RulePipeline(fqcn_mapping, prefilter=False).apply
+
+  print(f"{'engine':<16} {'jinja':>6} {'MB':>7} {'seconds':>8} {'MB/sec':>8} {'vs regex':>9}")
+  misses = []
+  for jinja_density in args.jinja_density:
+    # Only the transform is timed, the corpus is read into memory up front
+    directory_path = tempfile.mkdtemp(prefix='modernizr-corpus-')
+    try:
+      documents = []
+      for file_path in generate_corpus(directory_path, args.files, args.tasks, jinja_density):
+        with open(file_path, 'r') as file:
+          documents.append(file.read())
+    finally:
+      shutil.rmtree(directory_path)
+    size_mb = sum(len(document) for document in documents) / (1024 * 1024)
+
+    timings = {engine: min(timeit.repeat(lambda: [apply(document) for document in documents], number=1, repeat=args.repeat)) for engine, apply in engines.items()}
+    for engine, elapsed in timings.items():
+      speed = timings['regex'] / elapsed
+      print(f"{engine:<16} {jinja_density:>6.2f} {size_mb:>7.2f} {elapsed:>8.3f} {size_mb / elapsed:>8.2f} {speed:>8.2f}x")
+      if speed < 1 and engine in convertV3.pipelines:
+        misses.append(f"{engine} at jinja density {jinja_density:.2f}: {speed:.2f}x the regex engine")
+
+  if misses:
+    print("\nMissed the regex engine baseline:")
+    for miss in misses:
+      print(f"  {miss}")
+
+if __name__ == "__main__":
+  main()
@@ -11,7 +11,7 @@ def process_file(file_path, patterns_and_replacements, skip_list):
 
     # Apply each pattern and replacement function
     for pattern, replacement_function in patterns_and_replacements:
-      file_contents = re.sub(pattern, replacement_function, file_contents)
+      file_contents = pattern.sub(replacement_function, file_contents)
 
     # Check if '---' is present at the start of the file, if not, add it
     if not file_contents.startswith('---\n'):
@@ -139,6 +139,9 @@ def main():
     (r'\s(yum_repository:)', lambda match: ' ansible.builtin.' + match.group(1)),
   ]
 
+  # Compile the patterns once instead of going through the re cache for every file
+  patterns_and_replacements = [(re.compile(pattern), replacement) for pattern, replacement in patterns_and_replacements]
+
   # Process files in parallel
   process_files_in_parallel(args.path, patterns_and_replacements, args.skip_list, args.skip_dirs)
 
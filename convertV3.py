@@ -1,8 +1,42 @@
 import os
+import io
 import re
+import sys
+import json
+import select
+import asyncio
+import struct
+import ctypes
+import ctypes.util
+import threading
+import socketserver
+import difflib
+import fnmatch
+import subprocess
+import bisect
+import shutil
+import hashlib
 import argparse
+import pickle
 import logging
-from concurrent.futures import ThreadPoolExecutor
+import tempfile
+import time
+import multiprocessing
+from collections import Counter
+from stat import S_ISSOCK
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor, BrokenExecutor, FIRST_COMPLETED, wait
+
+# PyYAML is only needed by the structure aware engine
+try:
+  import yaml
+  import yaml.cyaml
+except ImportError:
+  yaml = None
+
+executors = {'thread': ThreadPoolExecutor, 'process': ProcessPoolExecutor}
+
+def configure_logging():
+  logging.basicConfig(filename='yaml_processing.log', level=logging.INFO, format='%(asctime)s - %(levelname)s: %(message)s')
 
 def load_fqcn_mapping(mapping_file):
   fqcn_mapping = {}
@@ -17,85 +51,1668 @@ def load_fqcn_mapping(mapping_file):
     logging.error(f"Mapping file '{mapping_file}' not found.")
   return fqcn_mapping
 
-def process_file(file_path, fqcn_mapping):
-  try:
-    with open(file_path, 'r') as file:
-      file_contents = file.read()
-
-    patterns_and_replacements = [
-      # Jinja spacing
-      (r'{{?([\w|(])', lambda match: "{{ " + match.group(1)),
-      (r'(\w|\))}}', lambda match: match.group(1) + " }}"),
-      (r'(\w)\|(\w)', lambda match: match.group(1) + " |"),
-      # TODO fix (r'(\w)\|(\w)', lambda match: "| " + match.group(2)),
-      # Adds space after #'s
-      (r'#(\w)', lambda match: "# " + match.group(1)),
-      # Caps first character after - name:
-      (r'(- name:\s)(\w)', lambda match:  match.group(1) + (match.group(2)).capitalize()),
-      # Removes double blank lines
-      (r'\n\s*\n', '\n\n'),
-    ]
+# A compiled index starts with this line, followed by the pickled mapping
+mapping_index_magic = b'ansible-modernizr-mapping-index 1\n'
+mapping_line_pattern = re.compile(r'^([A-Za-z_]\w*)\s*:\s*([A-Za-z_]\w*\.[A-Za-z_]\w*)$')
+module_file_suffixes = ('.py', '.ps1')
+
+class MappingError(ValueError):
+  pass
+
+def is_mapping_index(mapping_file):
+  try:
+    with open(mapping_file, 'rb') as file:
+      return file.read(len(mapping_index_magic)) == mapping_index_magic
+  except OSError:
+    return False
+
+def load_mapping_index(index_file):
+  # The index was validated when it was compiled, so loading it is a single
+  # unpickle with no per line parsing. Returns the module to prefix mapping
+  # and the modules that a redirect renamed.
+  with open(index_file, 'rb') as file:
+    if file.read(len(mapping_index_magic)) != mapping_index_magic:
+      raise MappingError(f"'{index_file}' is not a compiled mapping index, build one with compile-mapping")
+    index = pickle.load(file)
+  return index['fqcn_mapping'], index['renames']
+
+def read_mapping_text(mapping_file, entries):
+  # Strict version of load_fqcn_mapping, every line must be a mapping, a
+  # comment or blank
+  with open(mapping_file, 'r') as file:
+    for line_number, line in enumerate(file, 1):
+      line = line.strip()
+      if not line or line.startswith('#'):
+        continue
+      match = mapping_line_pattern.match(line)
+      if match is None:
+        raise MappingError(f"{mapping_file}:{line_number}: expected 'module: namespace.collection', got '{line}'")
+      entries.append((match.group(1), f'{match.group(2)}.{match.group(1)}', f'{mapping_file}:{line_number}'))
+
+def read_yaml_file(yaml_file):
+  if yaml is None:
+    raise MappingError(f"Reading '{yaml_file}' needs PyYAML, install it with pip install pyyaml")
+  with open(yaml_file, 'r') as file:
+    try:
+      return yaml.safe_load(file) or {}
+    except yaml.YAMLError as e:
+      raise MappingError(f"{yaml_file}: {str(e).splitlines()[0]}")
+
+def collection_name(collection_path):
+  # Taken from galaxy.yml or MANIFEST.json, or else from an
+  # ansible_collections/<namespace>/<name> layout
+  galaxy_file = os.path.join(collection_path, 'galaxy.yml')
+  manifest_file = os.path.join(collection_path, 'MANIFEST.json')
+  if os.path.isfile(galaxy_file):
+    info = read_yaml_file(galaxy_file)
+  elif os.path.isfile(manifest_file):
+    with open(manifest_file, 'r') as file:
+      info = json.load(file).get('collection_info', {})
+  else:
+    parent, name = os.path.split(os.path.abspath(collection_path))
+    grandparent, namespace = os.path.split(parent)
+    if os.path.basename(grandparent) != 'ansible_collections':
+      raise MappingError(f"Cannot tell which collection '{collection_path}' is, it has no galaxy.yml or MANIFEST.json")
+    info = {'namespace': namespace, 'name': name}
+  if not info.get('namespace') or not info.get('name'):
+    raise MappingError(f"'{collection_path}' does not name its namespace and collection")
+  return f"{info['namespace']}.{info['name']}"
+
+def read_runtime_file(runtime_file, collection, entries, redirects):
+  # Module redirects from a meta/runtime.yml. Short names routed by
+  # ansible.builtin are what playbooks written for Ansible 2.9 use, so those
+  # are mapping entries in their own right.
+  plugin_routing = read_yaml_file(runtime_file).get('plugin_routing') or {}
+  for module_name, routing in sorted((plugin_routing.get('modules') or {}).items()):
+    target = (routing or {}).get('redirect')
+    if not target:
+      continue
+    source = f'{runtime_file}: {module_name}'
+    fqcn = f'{collection}.{module_name}'
+    if fqcn in redirects and redirects[fqcn][0] != target:
+      raise MappingError(f"{source}: redirects {fqcn} to {target}, but {redirects[fqcn][1]} redirects it to {redirects[fqcn][0]}")
+    redirects[fqcn] = (target, source)
+    if collection == 'ansible.builtin' and '.' not in module_name:
+      entries.append((module_name, fqcn, source))
+
+def read_mapping_source(source, entries, redirects):
+  # A source is a 'module: prefix' text file, a collection directory or a
+  # meta/runtime.yml. ansible-core keeps the ansible.builtin routing in
+  # ansible_builtin_runtime.yml.
+  if os.path.isdir(source):
+    collection = collection_name(source)
+    modules_dir = os.path.join(source, 'plugins', 'modules')
+    for root, _, files in os.walk(modules_dir):
+      for file in sorted(files):
+        module_name, suffix = os.path.splitext(file)
+        if suffix in module_file_suffixes and not module_name.startswith('_'):
+          entries.append((module_name, f'{collection}.{module_name}', os.path.join(root, file)))
+    runtime_file = os.path.join(source, 'meta', 'runtime.yml')
+    if os.path.isfile(runtime_file):
+      read_runtime_file(runtime_file, collection, entries, redirects)
+  elif os.path.basename(source) == 'ansible_builtin_runtime.yml':
+    read_runtime_file(source, 'ansible.builtin', entries, redirects)
+  elif os.path.basename(source) == 'runtime.yml':
+    read_runtime_file(source, collection_name(os.path.dirname(os.path.dirname(os.path.abspath(source)))), entries, redirects)
+  else:
+    read_mapping_text(source, entries)
+
+def resolve_redirects(fqcn, redirects):
+  # Follows a chain of redirects to the module that finally handles fqcn
+  chain = [fqcn]
+  while fqcn in redirects:
+    fqcn = redirects[fqcn][0]
+    if fqcn in chain:
+      raise MappingError(f"Redirect loop: {' -> '.join(chain + [fqcn])}")
+    chain.append(fqcn)
+  if fqcn.count('.') < 2:
+    raise MappingError(f"Redirect chain {' -> '.join(chain)} does not end in a fully qualified name")
+  return fqcn
+
+def compile_mapping(sources):
+  # Reads every source, resolves redirect chains and checks that no module
+  # ends up with two different targets. Returns the module to prefix mapping
+  # and the modules whose final name differs from the short name.
+  entries = []
+  redirects = {}
+  try:
+    for source in sources:
+      read_mapping_source(source, entries, redirects)
+  except OSError as e:
+    raise MappingError(str(e))
+
+  targets = {}
+  conflicts = []
+  for module_name, fqcn, source in entries:
+    fqcn = resolve_redirects(fqcn, redirects)
+    if module_name in targets and targets[module_name][0] != fqcn:
+      conflicts.append(f"{module_name}: {targets[module_name][0]} ({targets[module_name][1]}) and {fqcn} ({source})")
+    targets.setdefault(module_name, (fqcn, source))
+  if conflicts:
+    raise MappingError('Conflicting mapping entries:\n  ' + '\n  '.join(conflicts))
+
+  # Modules of one collection share a single prefix string, which pickle then
+  # stores once, so the index stays small and quick to load
+  fqcn_mapping = {}
+  renames = {}
+  prefixes = {}
+  for module_name, (fqcn, _) in sorted(targets.items()):
+    fqcn_prefix, final_name = fqcn.rsplit('.', 1)
+    fqcn_mapping[module_name] = prefixes.setdefault(fqcn_prefix, fqcn_prefix)
+    if final_name != module_name:
+      renames[module_name] = final_name
+  return fqcn_mapping, renames
+
+def write_mapping_index(index_file, fqcn_mapping, renames, sources):
+  index = {'fqcn_mapping': fqcn_mapping, 'renames': renames, 'sources': list(sources)}
+  write_file_atomically(index_file, mapping_index_magic + pickle.dumps(index, protocol=pickle.HIGHEST_PROTOCOL))
+
+# Matches any "key:" token preceded by whitespace, the module name is then looked
+# up in the mapping so the whole mapping is applied in a single scan of the file.
+# Splitting on it leaves [text, whitespace, key, text, whitespace, key, ...].
+fqcn_key_pattern = re.compile(r'(\s)([^\s:]+):')
+
+def replace_fqcn_modules(file_contents, fqcn_mapping, hits=None, renames=None):
+  # Keys that are not in the mapping, including already fully qualified ones
+  # such as ansible.builtin.copy:, are left untouched. Modules in renames were
+  # redirected to a module with another name.
+  return replace_fqcn_keys(fqcn_key_pattern.split(file_contents), fqcn_mapping, hits, renames)
+
+def replace_fqcn_keys(parts, fqcn_mapping, hits=None, renames=None):
+  # Rewrites the keys of a split file in place and joins it back together,
+  # which is cheaper than calling a replacement function for every match
+  for index in range(2, len(parts), 3):
+    module_name = parts[index]
+    fqcn_prefix = fqcn_mapping.get(module_name)
+    if fqcn_prefix is None:
+      parts[index] = module_name + ':'
+      continue
+    if hits is not None:
+      hits[f'fqcn:{module_name}'] += 1
+    parts[index - 1] = ' '
+    if renames and module_name in renames:
+      parts[index] = f'{fqcn_prefix}.{renames[module_name]}:'
+    else:
+      parts[index] = f'{fqcn_prefix}.{module_name}:'
+  return ''.join(parts)
+
+# Replacement functions live at module level rather than in lambdas so that a
+# RulePipeline can be pickled and shipped to process pool workers
+def space_jinja_open(match):
+  return "{{ " + match.group(1)
+
+def space_jinja_close(match):
+  return match.group(1) + " }}"
+
+def space_jinja_filter(match):
+  return match.group(1) + " |"
+
+def space_comment(match):
+  return "# " + match.group(1)
+
+def capitalize_name(match):
+  return match.group(1) + (match.group(2)).capitalize()
+
+# Define multiple named patterns and their corresponding replacement functions
+patterns_and_replacements = [
+  # Jinja spacing
+  ('jinja_open', r'{{?([\w|(])', space_jinja_open),
+  ('jinja_close', r'(\w|\))}}', space_jinja_close),
+  ('jinja_filter', r'(\w)\|(\w)', space_jinja_filter),
+  # TODO fix (r'(\w)\|(\w)', lambda match: "| " + match.group(2)),
+  # Adds space after #'s
+  ('comment_space', r'#(\w)', space_comment),
+  # Caps first character after - name:
+  ('name_capitalize', r'(- name:\s)(\w)', capitalize_name),
+  # Removes double blank lines
+  ('blank_lines', r'\n\s*\n', '\n\n'),
+]
+
+# Text a rule needs before it can match, tested on the text as the rules before
+# it left it. Rules left out always run: blank_lines has no literal to test.
+# jinja_open also fires on a single {.
+rule_features = {
+  'jinja_open': '{',
+  'jinja_close': '}}',
+  'jinja_filter': '|',
+  'comment_space': '#',
+  'name_capitalize': '- name:',
+}
+
+def add_document_markers(file_contents, hits=None):
+  return add_end_marker(add_start_marker(file_contents, hits), hits)
+
+def add_start_marker(file_contents, hits=None):
+  # Check if '---' is present at the start of the file, if not, add it
+  if not file_contents.startswith('---\n'):
+    file_contents = '---\n' + file_contents
+    if hits is not None:
+      hits['document_start'] += 1
+  return file_contents
+
+def add_end_marker(file_contents, hits=None):
+  # Check if '...' is present at the end of the file, if not, add it
+  if not file_contents.endswith('\n...\n'):
+    file_contents = file_contents.rstrip() + '\n...\n'
+    if hits is not None:
+      hits['document_end'] += 1
+  return file_contents
+
+def find_safe_cut(buffer):
+  # Index of the last newline in buffer that follows a character other than
+  # whitespace or a colon, or 0 when there is none yet
+  index = buffer.rfind('\n')
+  while index > 0:
+    if buffer[index - 1] != ':' and not buffer[index - 1].isspace():
+      return index
+    index = buffer.rfind('\n', 0, index)
+  return 0
+
+class RulePipeline:
+  # Compiles the text rules once so that per file work is only the scanning
+  # itself. The pipeline holds no per call state, so a single instance can be
+  # shared between threads or pickled for process pool workers.
+  engine = 'regex'
+  streaming = True
+
+  def __init__(self, fqcn_mapping, rules=patterns_and_replacements, renames=None, prefilter=True):
+    self.fqcn_mapping = dict(fqcn_mapping)
+    self.renames = dict(renames or {})
+    self.rules = [(name, re.compile(pattern), replacement) for name, pattern, replacement in rules]
+    # With prefilter set, rules whose feature is missing from the text and an
+    # FQCN pass without any mapped key among the candidates are skipped
+    self.prefilter = prefilter
+
+  def apply(self, file_contents, hits=None, profile=None, file_path=None):
+    # When a Counter is passed in as hits it receives the number of matches per
+    # rule, a Profile passed in as profile receives the time spent per rule.
+    # file_path only names the file in log messages.
+    return add_document_markers(self.apply_rules(file_contents, hits, profile), hits)
+
+  def apply_chunks(self, blocks, hits=None, profile=None):
+    # Streaming version of apply for files too large to hold in memory: takes
+    # the text as arbitrary blocks and yields the output in pieces. The text is
+    # cut just before a newline that follows a character other than whitespace
+    # or a colon. No rule can match across such a cut, so running the rules per
+    # piece gives exactly the output of apply.
+    buffer = ''
+    held = ''
+    first = True
+    for block in blocks:
+      buffer += block
+      cut = find_safe_cut(buffer)
+      if cut <= 0:
+        continue
+      held += self.apply_rules(buffer[:cut], hits, profile)
+      buffer = buffer[cut:]
+      # The start of document check needs the first few characters in one go
+      if first:
+        if len(held) < len('---\n'):
+          continue
+        held = add_start_marker(held, hits)
+        first = False
+      # Hold back the trailing whitespace and the last few characters, which
+      # the end of document check may still need to see or strip
+      keep = len(held) - len(held.rstrip()) + len('\n...\n')
+      if len(held) > keep:
+        yield held[:-keep]
+        held = held[-keep:]
+
+    held += self.apply_rules(buffer, hits, profile)
+    if first:
+      held = add_start_marker(held, hits)
+    yield add_end_marker(held, hits)
+
+  def apply_rules(self, file_contents, hits=None, profile=None):
+    if profile is not None and hits is None:
+      hits = Counter()
 
     # Apply each pattern and replacement function
-    for pattern, replacement_function in patterns_and_replacements:
-      file_contents = re.sub(pattern, replacement_function, file_contents)
+    for name, pattern, replacement in self.rules:
+      if self.prefilter and name in rule_features and rule_features[name] not in file_contents:
+        if profile is not None:
+          profile.skip_rule(name)
+        continue
+      if hits is None:
+        file_contents = pattern.sub(replacement, file_contents)
+        continue
+      start = time.perf_counter()
+      scanned = utf8_size(file_contents) if profile is not None else 0
+      file_contents, count = pattern.subn(replacement, file_contents)
+      if count:
+        hits[name] += count
+      if profile is not None:
+        profile.add_rule(name, time.perf_counter() - start, count, scanned)
+
+    # Replace module names with their corresponding FQCN prefixes. The keys
+    # come from the text as the rules left it, so a key a rule uncovered, such
+    # as debug: in #debug:, counts too. Without any mapped key the split text
+    # is dropped rather than joined back together.
+    start = time.perf_counter()
+    parts = fqcn_key_pattern.split(file_contents)
+    if self.prefilter and self.fqcn_mapping.keys().isdisjoint(parts[2::3]):
+      if profile is not None:
+        profile.skip_rule('fqcn')
+    elif profile is None:
+      file_contents = replace_fqcn_keys(parts, self.fqcn_mapping, hits, self.renames)
+    else:
+      scanned = utf8_size(file_contents)
+      module_hits = Counter()
+      file_contents = replace_fqcn_keys(parts, self.fqcn_mapping, module_hits, self.renames)
+      hits.update(module_hits)
+      profile.add_rule('fqcn', time.perf_counter() - start, sum(module_hits.values()), scanned)
+      profile.modules.update(module_hits)
+
+    return file_contents
+
+  def fingerprint(self):
+    # Identifies the engine, mapping and rule set, bump rules_version whenever
+    # a replacement function changes behaviour without changing its name
+    digest = hashlib.sha256(f'rules_version:{rules_version} engine:{self.engine}\n'.encode())
+    for name, pattern, replacement in self.rules:
+      digest.update(f'{name} {pattern.pattern} {getattr(replacement, "__name__", replacement)}\n'.encode())
+    for module_name, fqcn_prefix in sorted(self.fqcn_mapping.items()):
+      digest.update(f'{module_name}: {fqcn_prefix}\n'.encode())
+    for module_name, final_name in sorted(self.renames.items()):
+      digest.update(f'{module_name} -> {final_name}\n'.encode())
+    return digest.hexdigest()
+
+# Sequences under these keys, and the top level sequence of a document, hold
+# tasks (or plays). Only the mappings in them get FQCN and name rewrites.
+task_list_keys = {'tasks', 'pre_tasks', 'post_tasks', 'handlers', 'block', 'rescue', 'always'}
+
+# Keys of a play, as opposed to a task, that may still need a FQCN
+play_fqcn_keys = {'import_playbook'}
+
+# Inside a {{ }} expression only quoted strings, filter pipes and the closing
+# delimiter matter. How a Jinja string looks in the raw text depends on the
+# quoting of the YAML scalar around it.
+jinja_token_patterns = {
+  None: re.compile(r"""'[^'\n]*'|"[^"\n]*"|\||\}\}"""),
+  "'": re.compile(r"""''(?:[^']|'(?!'))*''|"[^"\n]*"|\||\}\}"""),
+  '"': re.compile(r"""\\"(?:[^"\\]|\\[^"])*\\"|'[^'\n]*'|\||\}\}"""),
+}
+comment_pattern = re.compile(r'(?<!\S)#')
+blank_lines_pattern = re.compile(r'\n\s*\n')
+
+def jinja_spacing_edits(raw, offset, style):
+  # Returns (index, index, ' ') inserts that put a space inside both {{ }}
+  # delimiters and around every filter pipe outside of quoted strings
+  token_pattern = jinja_token_patterns.get(style if style in ("'", '"') else None)
+  edits = []
+  position = raw.find('{{')
+  while position != -1:
+    index = position + 2
+    if raw.startswith('-', index):
+      index += 1
+    if index < len(raw) and raw[index] not in ' \n}':
+      edits.append((offset + index, offset + index, ' '))
+    close = None
+    for match in token_pattern.finditer(raw, index):
+      token = match.group()
+      if token == '}}':
+        close = match.start()
+        break
+      if token == '|':
+        pipe = match.start()
+        if raw[pipe - 1] not in ' \n':
+          edits.append((offset + pipe, offset + pipe, ' '))
+        if pipe + 1 < len(raw) and raw[pipe + 1] not in ' \n':
+          edits.append((offset + pipe + 1, offset + pipe + 1, ' '))
+    if close is None:
+      break
+    end = close - 1 if raw[close - 1] == '-' else close
+    if raw[end - 1] not in ' \n{':
+      edits.append((offset + end, offset + end, ' '))
+    position = raw.find('{{', close + 2)
+  return edits
+
+def yaml_event_parser(file_contents):
+  # The libyaml parser is several times faster than the pure Python one
+  if yaml.__with_libyaml__:
+    return yaml.cyaml.CParser(file_contents)
+  return yaml.BaseLoader(file_contents)
 
-    # Replace module names with their corresponding FQCN prefixes
-    for module_name, fqcn_prefix in fqcn_mapping.items():
-      pattern = fr'\s({re.escape(module_name)}:)'
-      replacement = f' {fqcn_prefix}.\g<1>' # noqa W605 #TODO come back and look into this
-      file_contents = re.sub(pattern, replacement, file_contents)
+class StructurePipeline(RulePipeline):
+  # Parses each file once into YAML events and applies the rules only where
+  # they belong: FQCN to the keys of task mappings, name capitalisation to the
+  # name of tasks and plays, Jinja spacing to flow scalars (block scalars are
+  # left as they are) and comment spacing and blank line removal outside of
+  # scalars. Everything else keeps its original formatting. Files that are
+  # not valid YAML go through the regex rules instead. It trades speed for
+  # that precision: building the YAML events alone takes about as long as
+  # the whole regex pipeline, so it runs at a quarter to half its speed.
+  engine = 'structure'
+  # YAML context cannot be tracked across independently processed chunks
+  streaming = False
 
-    # Check if '---' is present at the start of the file, if not, add it
-    if not file_contents.startswith('---\n'):
-      file_contents = '---\n' + file_contents
+  def __init__(self, fqcn_mapping, rules=patterns_and_replacements, renames=None):
+    if yaml is None:
+      raise RuntimeError("The structure engine needs PyYAML, install it with pip install pyyaml")
+    super().__init__(fqcn_mapping, rules, renames)
 
-    # Check if '...' is present at the end of the file, if not, add it
-    if not file_contents.endswith('\n...\n'):
-      file_contents = file_contents.rstrip() + '\n...\n'
+  def apply(self, file_contents, hits=None, profile=None, file_path=None):
+    start = time.perf_counter()
+    try:
+      edits = self.collect_edits(file_contents, hits)
+    except yaml.YAMLError as e:
+      logging.warning(f"Falling back to the regex rules for {file_path or 'a buffer'}, which is not valid YAML: {str(e).splitlines()[0]}")
+      if hits is not None:
+        hits['structure_fallback'] += 1
+      return super().apply(file_contents, hits, profile)
 
-    # Open the file for writing with the modified contents
-    with open(file_path, 'w') as file:
+    # Edits never overlap, so the text is rebuilt in a single splice
+    if edits:
+      edits.sort()
+      parts = []
+      position = 0
+      for edit_start, edit_end, replacement in edits:
+        parts.append(file_contents[position:edit_start])
+        parts.append(replacement)
+        position = edit_end
+      parts.append(file_contents[position:])
+      file_contents = ''.join(parts)
+
+    if profile is not None:
+      profile.add_rule('structure', time.perf_counter() - start, len(edits), utf8_size(file_contents))
+    return add_document_markers(file_contents, hits)
+
+  def collect_edits(self, file_contents, hits):
+    # Returns the (start, end, replacement) edits for the whole file
+    edits = []
+    # Spans of the scalars that may hold a # or a blank line of their own:
+    # quoted, block and multi-line plain scalars
+    protected = []
+    stack = []
+    frame = None
+    fqcn_mapping = self.fqcn_mapping
+    renames = self.renames
+    ScalarEvent, MappingStartEvent, SequenceStartEvent = yaml.ScalarEvent, yaml.MappingStartEvent, yaml.SequenceStartEvent
+    MappingEndEvent, SequenceEndEvent, AliasEvent = yaml.MappingEndEvent, yaml.SequenceEndEvent, yaml.AliasEvent
+
+    # The innermost open collection is kept in frame as well as on the stack
+    for event in iter(yaml_event_parser(file_contents).get_event, None):
+      event_type = type(event)
+
+      if event_type is ScalarEvent:
+        start, end = event.start_mark.index, event.end_mark.index
+        style = event.style or None
+        if style is not None or event.start_mark.line != event.end_mark.line:
+          protected.append((start, end))
+        if frame is not None and frame[0] == 'mapping':
+          if frame[2]:
+            # A key, remembered for the value that follows
+            frame[3] = event.value
+            frame[4].add(event.value)
+            if frame[1] and style is None and event.value in fqcn_mapping:
+              frame[5].append(('fqcn', (start, end, f'{fqcn_mapping[event.value]}.{renames.get(event.value, event.value)}'), event.value))
+            frame[2] = False
+            continue
+          frame[2] = True
+          if frame[1] and frame[3] == 'name' and style in (None, "'", '"'):
+            first = start if style is None else start + 1
+            if first < end and file_contents[first].islower():
+              frame[5].append(('name_capitalize', (first, first + 1, file_contents[first].upper()), None))
+        if style in (None, "'", '"'):
+          raw = file_contents[start:end]
+          if '{{' in raw:
+            inserts = jinja_spacing_edits(raw, start, style)
+            edits.extend(inserts)
+            if inserts and hits is not None:
+              hits['jinja_spacing'] += len(inserts)
+
+      elif event_type is MappingStartEvent:
+        # [kind, task item, expecting a key, current key, all keys, pending edits]
+        task_item = frame is not None and frame[0] == 'sequence' and frame[1]
+        frame = ['mapping', task_item, True, None, set(), []]
+        stack.append(frame)
+
+      elif event_type is SequenceStartEvent:
+        # [kind, holds tasks]
+        task_list = frame is None or (frame[0] == 'mapping' and not frame[2] and frame[3] in task_list_keys)
+        frame = ['sequence', task_list]
+        stack.append(frame)
+
+      elif event_type is MappingEndEvent or event_type is SequenceEndEvent:
+        stack.pop()
+        if frame[0] == 'mapping' and frame[1]:
+          # Whether a mapping is a play is only known once all its keys are seen
+          is_play = 'hosts' in frame[4]
+          for rule, edit, module_name in frame[5]:
+            if rule == 'name_capitalize' or not is_play or module_name in play_fqcn_keys:
+              edits.append(edit)
+              if hits is not None:
+                hits[rule if rule == 'name_capitalize' else f'fqcn:{module_name}'] += 1
+        frame = stack[-1] if stack else None
+        if frame is not None and frame[0] == 'mapping':
+          frame[2] = not frame[2]
+
+      elif event_type is AliasEvent:
+        if frame is not None and frame[0] == 'mapping':
+          frame[2] = not frame[2]
+
+    edits.extend(self.gap_edits(file_contents, protected, hits))
+    return edits
+
+  def gap_edits(self, file_contents, protected, hits):
+    # Comment spacing and blank line removal for everything outside the
+    # protected scalars
+    edits = []
+    starts = [start for start, _ in protected]
+
+    def is_protected(start, end):
+      index = bisect.bisect_right(starts, end - 1) - 1
+      return index >= 0 and protected[index][1] > start
+
+    comment_end = -1
+    for match in comment_pattern.finditer(file_contents):
+      index = match.start()
+      # Only the # that starts a comment, not any further ones inside it
+      if index < comment_end or is_protected(index, index + 1):
+        continue
+      comment_end = file_contents.find('\n', index)
+      if comment_end == -1:
+        comment_end = len(file_contents)
+      following = file_contents[index + 1:index + 2]
+      if following and (following.isalnum() or following == '_'):
+        edits.append((index + 1, index + 1, ' '))
+        if hits is not None:
+          hits['comment_space'] += 1
+
+    for match in blank_lines_pattern.finditer(file_contents):
+      if match.end() - match.start() > 2 and not is_protected(match.start(), match.end()):
+        edits.append((match.start(), match.end(), '\n\n'))
+        if hits is not None:
+          hits['blank_lines'] += 1
+    return edits
+
+pipelines = {'regex': RulePipeline, 'structure': StructurePipeline}
+
+rules_version = 2
+
+def utf8_size(text):
+  # Bytes the text takes up as UTF-8, without encoding it when it is ASCII
+  return len(text) if text.isascii() else len(text.encode('utf-8'))
+
+class Profile:
+  # Accumulates wall time, matches, bytes scanned and passes the
+  # prefilter skipped per rule, matches per FQCN module, and read/transform/
+  # write time and skipped passes per file. Profiles from separate workers are
+  # combined with merge.
+  def __init__(self):
+    self.rules = {}
+    self.modules = Counter()
+    self.files = {}
+    self.skipped = {}
+    self.passes_skipped = 0
+
+  def add_rule(self, name, seconds, matches, scanned, skipped=0):
+    totals = self.rules.setdefault(name, [0.0, 0, 0, 0])
+    totals[0] += seconds
+    totals[1] += matches
+    totals[2] += scanned
+    totals[3] += skipped
+
+  def skip_rule(self, name):
+    self.add_rule(name, 0.0, 0, 0, 1)
+    self.passes_skipped += 1
+
+  def add_file(self, file_path, stage, seconds):
+    self.files.setdefault(file_path, {})[stage] = seconds
+
+  def add_skipped(self, file_path, passes):
+    self.skipped[file_path] = passes
+
+  def merge(self, other):
+    for name, (seconds, matches, scanned, skipped) in other.rules.items():
+      self.add_rule(name, seconds, matches, scanned, skipped)
+    self.modules.update(other.modules)
+    for file_path, stages in other.files.items():
+      self.files.setdefault(file_path, {}).update(stages)
+    self.skipped.update(other.skipped)
+    self.passes_skipped += other.passes_skipped
+
+  def stage_totals(self):
+    totals = Counter()
+    for stages in self.files.values():
+      totals.update(stages)
+    return totals
+
+  def to_dict(self):
+    return {
+      'rules': {name: {'seconds': seconds, 'matches': matches, 'scanned': scanned, 'skipped': skipped} for name, (seconds, matches, scanned, skipped) in self.rules.items()},
+      'modules': dict(self.modules),
+      'stages': dict(self.stage_totals()),
+      'files': self.files,
+      'skipped_passes': self.skipped,
+    }
+
+  def table(self, limit=10):
+    lines = [f"{'rule':<20} {'seconds':>10} {'matches':>10} {'bytes scanned':>15} {'skipped':>10}"]
+    for name, (seconds, matches, scanned, skipped) in sorted(self.rules.items(), key=lambda item: item[1][0], reverse=True):
+      lines.append(f"{name:<20} {seconds:>10.4f} {matches:>10} {scanned:>15} {skipped:>10}")
+    if self.skipped:
+      lines.append(f"{self.passes_skipped} passes skipped by the prefilter, {sum(1 for passes in self.skipped.values() if passes)} of {len(self.skipped)} files skipped at least one")
+
+    lines.append('')
+    lines.append(f"{'stage':<20} {'seconds':>10}")
+    for stage, seconds in sorted(self.stage_totals().items(), key=lambda item: item[1], reverse=True):
+      lines.append(f"{stage:<20} {seconds:>10.4f}")
+
+    if self.modules:
+      lines.append('')
+      lines.append(f"{'fqcn module':<30} {'matches':>10}")
+      for module_name, matches in self.modules.most_common(limit):
+        lines.append(f"{module_name.removeprefix('fqcn:'):<30} {matches:>10}")
+
+    lines.append('')
+    lines.append(f"{'slowest files':<60} {'seconds':>10}")
+    slowest = sorted(self.files.items(), key=lambda item: sum(item[1].values()), reverse=True)[:limit]
+    for file_path, stages in slowest:
+      lines.append(f"{file_path:<60} {sum(stages.values()):>10.4f}")
+    return '\n'.join(lines)
+
+def content_digest(file_contents):
+  return hashlib.sha256(file_contents.encode()).hexdigest()
+
+class ConversionCache:
+  # Remembers the size, mtime and content hash every file was left with by the
+  # previous run. Entries are only trusted when the pipeline fingerprint matches.
+  # After a walk of the whole tree, entries for files that were not seen are
+  # dropped on save. After a run over a subset, such as the files git listed,
+  # they are kept.
+  def __init__(self, cache_file, directory_path, fingerprint):
+    self.cache_file = cache_file
+    self.directory_path = directory_path
+    self.fingerprint = fingerprint
+    self.entries = {}
+    self.new_entries = {}
+    self.seen = set()
+    try:
+      with open(cache_file, 'r') as file:
+        cache = json.load(file)
+      if cache.get('fingerprint') == fingerprint:
+        self.entries = cache.get('files', {})
+    except FileNotFoundError:
+      pass
+    except (ValueError, AttributeError) as e:
+      logging.warning(f"Ignoring unreadable cache file '{cache_file}': {str(e)}")
+
+  def key(self, file_path):
+    return os.path.relpath(file_path, self.directory_path)
+
+  def is_unchanged(self, file_path):
+    # Only a stat is needed to skip a file that has not been touched since it
+    # was converted
+    self.seen.add(self.key(file_path))
+    entry = self.entries.get(self.key(file_path))
+    if entry is None:
+      return False
+    try:
+      stat = os.stat(file_path)
+    except OSError:
+      return False
+    if [stat.st_mtime_ns, stat.st_size] != entry[:2]:
+      return False
+    self.new_entries[self.key(file_path)] = entry
+    return True
+
+  def digest(self, file_path):
+    entry = self.entries.get(self.key(file_path))
+    return entry[2] if entry else None
+
+  def record(self, file_path, digest):
+    try:
+      stat = os.stat(file_path)
+    except OSError:
+      return
+    self.new_entries[self.key(file_path)] = [stat.st_mtime_ns, stat.st_size, digest]
+
+  def save(self, partial=False):
+    # With partial set only some of the files were looked at this run
+    if partial:
+      for key, entry in self.entries.items():
+        if key not in self.seen:
+          self.new_entries.setdefault(key, entry)
+    write_file_atomically(self.cache_file, json.dumps({'fingerprint': self.fingerprint, 'files': self.new_entries}))
+
+# os.umask can only be read by setting it, so it is read once here rather than
+# while worker threads may be creating files
+process_umask = os.umask(0)
+os.umask(process_umask)
+
+def create_temp_file(file_path, mode='w'):
+  # A temporary file next to the target, symlinks followed, so os.replace
+  # stays on one filesystem
+  fd, temp_path = tempfile.mkstemp(dir=os.path.dirname(os.path.realpath(file_path)), prefix='.modernizr-', suffix='.tmp')
+  return os.fdopen(fd, mode), temp_path
+
+def fsync_path(path):
+  fd = os.open(path, os.O_RDONLY)
+  try:
+    os.fsync(fd)
+  finally:
+    os.close(fd)
+
+def replace_file(temp_path, file_path):
+  # Swaps the finished temporary file in for file_path, flushed to disk first
+  # so a crash leaves either the old or the new contents. A symlink is
+  # followed, so its target is converted and the link stays a link. The mode
+  # and, where permitted, the owner of the old file carry over, and a new file
+  # gets the usual 0666 less the umask rather than the 0600 of mkstemp. A file
+  # with other hard links is refused and left as it is, as replacing it would
+  # split it from its other names and writing it in place is not atomic.
+  real_path = os.path.realpath(file_path)
+  try:
+    stat = os.stat(real_path)
+  except FileNotFoundError:
+    stat = None
+  if stat is not None and stat.st_nlink > 1:
+    raise OSError(f"{file_path} has other hard links, which replacing it would break, so it was skipped")
+
+  fsync_path(temp_path)
+  if stat is not None:
+    shutil.copymode(real_path, temp_path)
+    temp_stat = os.stat(temp_path)
+    if hasattr(os, 'chown') and (stat.st_uid, stat.st_gid) != (temp_stat.st_uid, temp_stat.st_gid):
+      try:
+        os.chown(temp_path, stat.st_uid, stat.st_gid)
+      except PermissionError:
+        pass
+  else:
+    os.chmod(temp_path, 0o666 & ~process_umask)
+  os.replace(temp_path, real_path)
+  # The rename itself is only durable once the directory is flushed, which
+  # not every platform allows
+  try:
+    fsync_path(os.path.dirname(real_path))
+  except OSError:
+    pass
+
+def write_file_atomically(file_path, file_contents):
+  # Write to a temporary file next to the target and swap it in, so an
+  # interrupted run never leaves a truncated file behind
+  file, temp_path = create_temp_file(file_path, 'wb' if isinstance(file_contents, bytes) else 'w')
+  try:
+    with file:
       file.write(file_contents)
+    replace_file(temp_path, file_path)
+  except BaseException:
+    os.unlink(temp_path)
+    raise
+
+def unified_diff(file_path, original_contents, file_contents):
+  # Paths are relative to the working directory so the diff applies with patch -p1
+  label = os.path.relpath(file_path)
+  diff_lines = difflib.unified_diff(original_contents.splitlines(keepends=True), file_contents.splitlines(keepends=True), f'a/{label}', f'b/{label}')
+  # Mark a missing trailing newline the way git does so the diff still applies
+  return ''.join(line if line.endswith('\n') else line + '\n\\ No newline at end of file\n' for line in diff_lines)
+
+def render_report(report, file_path, original_contents, file_contents, hits):
+  if report == 'diff':
+    return unified_diff(file_path, original_contents, file_contents)
+  if report == 'json':
+    return json.dumps({'path': file_path, 'hits': dict(hits)}) + '\n'
+  return file_path + '\n'
+
+def file_blocks(file_path, chunk_size, digest=None):
+  # Reads file_path in blocks of chunk_size characters, feeding them to digest
+  with open(file_path, 'r') as file:
+    while True:
+      block = file.read(chunk_size)
+      if not block:
+        return
+      if digest is not None:
+        digest.update(block.encode())
+      yield block
 
-    logging.info(f"Processed file: {file_path}")
+def process_large_file(file_path, pipeline, known_digest=None, report=None, profile=None, chunk_size=4 * 1024 * 1024):
+  # Same contract as process_file, but the file is read, transformed and
+  # written in chunks so memory stays flat whatever the file size. The output
+  # goes to a temporary file that only replaces the original when it differs.
+  try:
+    if known_digest is not None:
+      input_digest = hashlib.sha256()
+      for _ in file_blocks(file_path, chunk_size, input_digest):
+        pass
+      if input_digest.hexdigest() == known_digest:
+        logging.info(f"Skipped unchanged file: {file_path}")
+        return 'unchanged', known_digest, None
+
+    start = time.perf_counter()
+    passes_skipped = profile.passes_skipped if profile is not None else 0
+    input_digest = hashlib.sha256()
+    output_digest = hashlib.sha256()
+    hits = Counter() if report == 'json' else None
+    file, temp_path = (None, None) if report is not None else create_temp_file(file_path)
+    try:
+      for piece in pipeline.apply_chunks(file_blocks(file_path, chunk_size, input_digest), hits, profile):
+        output_digest.update(piece.encode())
+        if file is not None:
+          file.write(piece)
+      if file is not None:
+        file.close()
+      changed = input_digest.hexdigest() != output_digest.hexdigest()
+      if file is not None and changed:
+        replace_file(temp_path, file_path)
+        temp_path = None
+    finally:
+      if file is not None:
+        file.close()
+        if temp_path is not None:
+          os.unlink(temp_path)
+    if profile is not None:
+      profile.add_file(file_path, 'stream', time.perf_counter() - start)
+      profile.add_skipped(file_path, profile.passes_skipped - passes_skipped)
+
+    if not changed:
+      logging.info(f"Unchanged file: {file_path}")
+      return 'unchanged', input_digest.hexdigest(), None
+    if report is not None:
+      logging.info(f"Checked file: {file_path}")
+      return 'changed', input_digest.hexdigest(), render_report(report, file_path, None, None, hits)
+    logging.info(f"Processed large file: {file_path}")
+    return 'changed', output_digest.hexdigest(), None
   except Exception as e:
     logging.error(f"Error processing file {file_path}: {str(e)}")
+    return 'failed', None, str(e)
+
+def read_contents(file_path, known_digest=None, profile=None):
+  # The read step of process_file. Returns the contents and their hash, with
+  # the contents None when the hash is known_digest: a file that was touched
+  # but still holds the output of the previous run needs no second conversion.
+  start = time.perf_counter()
+  with open(file_path, 'r') as file:
+    original_contents = file.read()
+  digest = content_digest(original_contents)
+  if profile is not None:
+    profile.add_file(file_path, 'read', time.perf_counter() - start)
+  if digest == known_digest:
+    logging.info(f"Skipped unchanged file: {file_path}")
+    return None, digest
+  return original_contents, digest
+
+def transform_contents(pipeline, file_path, original_contents, report=None, profile=None):
+  # The transform step of process_file. Returns the new contents and, for
+  # json reports, the rule hits.
+  start = time.perf_counter()
+  passes_skipped = profile.passes_skipped if profile is not None else 0
+  hits = Counter() if report == 'json' else None
+  file_contents = pipeline.apply(original_contents, hits, profile, file_path)
+  if profile is not None:
+    profile.add_file(file_path, 'transform', time.perf_counter() - start)
+    profile.add_skipped(file_path, profile.passes_skipped - passes_skipped)
+  return file_contents, hits
+
+def finish_file(file_path, original_contents, file_contents, digest, hits=None, report=None, profile=None):
+  # The last step of process_file, which renders the report in check mode and
+  # writes the new contents otherwise. Files that no rule touched are left
+  # alone so their mtime stays intact. Returns the result of process_file.
+  if file_contents == original_contents:
+    logging.info(f"Unchanged file: {file_path}")
+    return 'unchanged', digest, None
+
+  if report is not None:
+    logging.info(f"Checked file: {file_path}")
+    return 'changed', digest, render_report(report, file_path, original_contents, file_contents, hits)
+
+  start = time.perf_counter()
+  write_file_atomically(file_path, file_contents)
+  if profile is not None:
+    profile.add_file(file_path, 'write', time.perf_counter() - start)
+
+  logging.info(f"Processed file: {file_path}")
+  return 'changed', content_digest(file_contents), None
+
+def process_file(file_path, pipeline, known_digest=None, report=None, profile=None, large_file_size=None):
+  # Returns whether the file was 'changed', 'unchanged' or 'failed', the
+  # content hash the file is left with and, in check mode, the report text or,
+  # on failure, the error message. With report set to 'names', 'diff' or
+  # 'json' the file is never written. Files over large_file_size bytes are
+  # streamed in chunks, except for diffs which need both texts in full.
+  try:
+    if large_file_size and pipeline.streaming and report != 'diff' and os.path.getsize(file_path) > large_file_size:
+      return process_large_file(file_path, pipeline, known_digest, report, profile)
+
+    original_contents, digest = read_contents(file_path, known_digest, profile)
+    if original_contents is None:
+      return 'unchanged', digest, None
+    file_contents, hits = transform_contents(pipeline, file_path, original_contents, report, profile)
+    return finish_file(file_path, original_contents, file_contents, digest, hits, report, profile)
+  except Exception as e:
+    logging.error(f"Error processing file {file_path}: {str(e)}")
+    return 'failed', None, str(e)
+
+
+# The pipeline is handed to each worker once through the executor initializer,
+# so batches only carry file paths across the process boundary
+worker_pipeline = None
+worker_report = None
+worker_profiling = False
+worker_large_file_size = None
+
+def init_worker(pipeline, report=None, profiling=False, large_file_size=None):
+  global worker_pipeline, worker_report, worker_profiling, worker_large_file_size
+  worker_pipeline = pipeline
+  worker_report = report
+  worker_profiling = profiling
+  worker_large_file_size = large_file_size
+  # Spawned processes do not inherit the logging setup of the parent
+  if multiprocessing.parent_process() is not None and not logging.getLogger().handlers:
+    configure_logging()
+
+def process_batch(batch):
+  # Returns the per file results and, when profiling, the profile of the batch
+  profile = Profile() if worker_profiling else None
+  results = [(file_path, *process_file(file_path, worker_pipeline, known_digest, worker_report, profile, worker_large_file_size)) for file_path, known_digest in batch]
+  return results, profile
+
+def load_ignore_patterns(directory_path):
+  # Glob patterns, one per line, from .ansible-modernizr-ignore at the top of
+  # the tree. This is a subset of .gitignore: ! negation and ** are not
+  # supported, and such lines are reported and left out rather than matched
+  # as literal globs that never match.
+  try:
+    with open(os.path.join(directory_path, '.ansible-modernizr-ignore'), 'r') as file:
+      lines = [line.strip() for line in file]
+  except FileNotFoundError:
+    return []
+
+  patterns = []
+  for line in lines:
+    if not line or line.startswith('#'):
+      continue
+    if line.startswith('!') or '**' in line:
+      message = f"Skipping unsupported pattern '{line}' in .ansible-modernizr-ignore, ! negation and ** are not supported"
+      logging.warning(message)
+      print(message, file=sys.stderr)
+      continue
+    patterns.append(line.rstrip('/'))
+  return patterns
+
+def is_ignored(relative_path, ignore_patterns):
+  # Patterns with a slash, leading ones such as /vendor included, match the
+  # path relative to the top of the tree one name at a time, so * and ? never
+  # match a slash. Patterns without one match any single file or directory
+  # name, as in .gitignore.
+  names = relative_path.split(os.sep)
+  for pattern in ignore_patterns:
+    if '/' in pattern:
+      pattern_names = pattern.lstrip('/').split('/')
+      if len(pattern_names) == len(names) and all(fnmatch.fnmatch(name, pattern_name) for name, pattern_name in zip(names, pattern_names)):
+        return True
+    elif fnmatch.fnmatch(names[-1], pattern):
+      return True
+  return False
+
+def find_yaml_files(directory_path, skip_list, skip_dirs):
+  ignore_patterns = load_ignore_patterns(directory_path)
+  for root, dirs, files in os.walk(directory_path):
+    # Filter out directories based on the provided skip_dirs argument, git
+    # metadata is never walked
+    dirs[:] = [d for d in dirs if d not in skip_dirs and d != '.git' and not is_ignored(os.path.relpath(os.path.join(root, d), directory_path), ignore_patterns)]
+    for file_name in files:
+      if file_name in skip_list:
+        continue
+      elif file_name.endswith(('.yml', '.yaml')):
+        file_path = os.path.join(root, file_name)
+        if not is_ignored(os.path.relpath(file_path, directory_path), ignore_patterns):
+          yield file_path
+
+def git_file_list(directory_path, command, *git_args):
+  # Paths come back relative to directory_path and NUL separated
+  result = subprocess.run(['git', '-C', directory_path, command, '-z', *git_args], check=True, capture_output=True, text=True)
+  return [name for name in result.stdout.split('\0') if name]
+
+def find_git_files(directory_path, skip_list, skip_dirs, changed_since=None, include_untracked=True):
+  # Lists files from the git index instead of walking the tree, which also
+  # honours .gitignore. With changed_since only files that differ from that
+  # ref are returned. Raises CalledProcessError outside a git work tree.
+  if changed_since:
+    relative_paths = git_file_list(directory_path, 'diff', '--name-only', '--relative', '--diff-filter=d', changed_since, '--')
+  else:
+    relative_paths = git_file_list(directory_path, 'ls-files', '--cached')
+  if include_untracked:
+    relative_paths += git_file_list(directory_path, 'ls-files', '--others', '--exclude-standard')
+
+  ignore_patterns = load_ignore_patterns(directory_path)
+  file_paths = []
+  for relative_path in sorted(set(relative_paths)):
+    parts = relative_path.split('/')
+    if not parts[-1].endswith(('.yml', '.yaml')) or parts[-1] in skip_list:
+      continue
+    if any(part in skip_dirs for part in parts[:-1]):
+      continue
+    # Check the file itself and every directory above it against the ignore file
+    if any(is_ignored('/'.join(parts[:depth]), ignore_patterns) for depth in range(1, len(parts) + 1)):
+      continue
+    file_path = os.path.join(directory_path, *parts)
+    # Files deleted from the work tree can still be listed in the index
+    if os.path.isfile(file_path):
+      file_paths.append(file_path)
+  return file_paths
+
+def batched(items, batch_size):
+  batch = []
+  for item in items:
+    batch.append(item)
+    if len(batch) >= batch_size:
+      yield batch
+      batch = []
+  if batch:
+    yield batch
+
+def pending_files(file_paths, cache, counts):
+  for file_path in file_paths:
+    if cache is None:
+      yield file_path, None
+    elif cache.is_unchanged(file_path):
+      logging.info(f"Skipped cached file: {file_path}")
+      counts['unchanged'] += 1
+    else:
+      yield file_path, cache.digest(file_path)
+
+def handle_result(file_path, status, digest, text, counts, cache, report, output):
+  # Counts a result of process_file and passes it on: errors to stderr,
+  # reports to output and, outside check mode, the content hash to the cache
+  counts[status] += 1
+  if status == 'failed':
+    print(f"Error processing file {file_path}: {text}", file=sys.stderr)
+  elif text:
+    output.write(text)
+    output.flush()
+  elif cache is not None and report is None and digest is not None:
+    cache.record(file_path, digest)
+
+def process_files_in_parallel(directory_path, skip_list, skip_dirs, pipeline, jobs=None, executor_type='thread', batch_size=None, cache=None, report=None, output=None, file_paths=None, max_in_flight=None, profile=None, large_file_size=None):
+  # Returns a Counter of files per outcome. In check mode (report set) the
+  # reports are written to output, stdout unless given, as batches finish and
+  # nothing is written to the tree, the cache included. Without file_paths
+  # the tree is walked.
+  # Results come back a batch at a time, so batch_size defaults to 1 in check
+  # mode for the reports to stream per file, and to 32 otherwise.
+  #
+  # Discovery is a lazy generator feeding at most max_in_flight batches to the
+  # workers, each of which reads, transforms and writes its files. Once the
+  # window is full discovery waits for a batch to finish, so memory stays
+  # bounded however large the tree is. Batch profiles are merged into profile.
+  # A worker that dies takes its pool down, failing the batches in flight, and
+  # the rest of the run goes to a new pool.
+  executor_class = executors[executor_type]
+  output = sys.stdout if output is None else output
+  if batch_size is None:
+    batch_size = 1 if report is not None else 32
+  if max_in_flight is None:
+    max_in_flight = 2 * (jobs or os.cpu_count() or 1)
+  counts = Counter()
+  partial = file_paths is not None
+  if file_paths is None:
+    file_paths = find_yaml_files(directory_path, skip_list, skip_dirs)
+
+  def collect(futures):
+    for future in futures:
+      batch = pending.pop(future)
+      try:
+        results, batch_profile = future.result()
+      except Exception as e:
+        # A worker that died takes the whole batch down with it
+        results, batch_profile = [(file_path, 'failed', None, str(e)) for file_path, _ in batch], None
+      if profile is not None and batch_profile is not None:
+        profile.merge(batch_profile)
+      for file_path, status, digest, text in results:
+        handle_result(file_path, status, digest, text, counts, cache, report, output)
+
+  def start_executor():
+    return executor_class(max_workers=jobs, initializer=init_worker, initargs=(pipeline, report, profile is not None, large_file_size))
+
+  def submit(batch):
+    nonlocal executor
+    try:
+      future = executor.submit(process_batch, batch)
+    except BrokenExecutor:
+      collect(wait(pending).done)
+      executor.shutdown()
+      executor = start_executor()
+      future = executor.submit(process_batch, batch)
+    pending[future] = batch
+
+  pending = {}
+  executor = start_executor()
+  try:
+    for batch in batched(pending_files(file_paths, cache, counts), batch_size):
+      submit(batch)
+      # Hand on the results of batches that already finished so output
+      # streams, and block while the window is full
+      done, _ = wait(pending, timeout=0 if len(pending) < max_in_flight else None, return_when=FIRST_COMPLETED)
+      collect(done)
+    while pending:
+      done, _ = wait(pending, return_when=FIRST_COMPLETED)
+      collect(done)
+  finally:
+    executor.shutdown()
+
+  if cache is not None and report is None:
+    cache.save(partial)
+  return counts
+
+def scan_directory(dir_path):
+  # One directory listing as (file names, directory names), with symlinked
+  # directories left out as os.walk does not descend into them either
+  files, dirs = [], []
+  try:
+    with os.scandir(dir_path) as entries:
+      for entry in entries:
+        if not entry.is_dir():
+          files.append(entry.name)
+        elif not entry.is_symlink():
+          dirs.append(entry.name)
+  except OSError as e:
+    logging.warning(f"Cannot list directory {dir_path}: {str(e)}")
+  return files, dirs
+
+def transform_in_worker(file_path, original_contents):
+  # transform_contents in the worker pool of async mode, with the pipeline set
+  # up by init_worker. The profile comes back for the caller to merge.
+  profile = Profile() if worker_profiling else None
+  file_contents, hits = transform_contents(worker_pipeline, file_path, original_contents, worker_report, profile)
+  return file_contents, hits, profile
+
+async def process_files_async(directory_path, skip_list, skip_dirs, pipeline, jobs=None, executor_type='thread', cache=None, report=None, output=None, file_paths=None, max_in_flight=None, profile=None, large_file_size=None, io_concurrency=32):
+  # Same contract as process_files_in_parallel, for trees on network or
+  # otherwise slow filesystems where every call waits on a round trip.
+  # Directories are listed concurrently and files are read and written
+  # concurrently on a thread pool, io_concurrency calls at a time, while the
+  # transforms run on the thread or process pool picked by executor_type.
+  # Discovery feeds a queue that max_in_flight consumers take files from, so
+  # no more files than that are held in memory at once.
+  loop = asyncio.get_running_loop()
+  output = sys.stdout if output is None else output
+  io_limit = asyncio.Semaphore(io_concurrency)
+  queue = asyncio.Queue(maxsize=io_concurrency)
+  consumers = max_in_flight or 2 * io_concurrency
+  counts = Counter()
+  if not (large_file_size and pipeline.streaming and report != 'diff'):
+    large_file_size = None
+
+  async def run_io(function, *args):
+    async with io_limit:
+      return await loop.run_in_executor(io_executor, function, *args)
+
+  async def scan(dir_path, ignore_patterns):
+    files, dirs = await run_io(scan_directory, dir_path)
+    for file_name in sorted(files):
+      file_path = os.path.join(dir_path, file_name)
+      if file_name not in skip_list and file_name.endswith(('.yml', '.yaml')) and not is_ignored(os.path.relpath(file_path, directory_path), ignore_patterns):
+        await queue.put(file_path)
+    subdirs = [os.path.join(dir_path, d) for d in sorted(dirs) if d not in skip_dirs and d != '.git']
+    await asyncio.gather(*(scan(d, ignore_patterns) for d in subdirs if not is_ignored(os.path.relpath(d, directory_path), ignore_patterns)))
+
+  async def produce():
+    try:
+      if file_paths is None:
+        await scan(directory_path, await run_io(load_ignore_patterns, directory_path))
+      else:
+        for file_path in file_paths:
+          await queue.put(file_path)
+    finally:
+      for _ in range(consumers):
+        await queue.put(None)
+
+  async def convert(file_path, known_digest):
+    # process_file, with the waits handed to the pools. Work that may overlap
+    # with other files gets a profile of its own, so passes skipped are
+    # counted per file.
+    if large_file_size and await run_io(os.path.getsize, file_path) > large_file_size:
+      file_profile = Profile() if profile is not None else None
+      result = await run_io(process_large_file, file_path, pipeline, known_digest, report, file_profile)
+      if file_profile is not None:
+        profile.merge(file_profile)
+      return result
+    original_contents, digest = await run_io(read_contents, file_path, known_digest, profile)
+    if original_contents is None:
+      return 'unchanged', digest, None
+    file_contents, hits, file_profile = await loop.run_in_executor(cpu_executor, transform_in_worker, file_path, original_contents)
+    if file_profile is not None:
+      profile.merge(file_profile)
+    return await run_io(finish_file, file_path, original_contents, file_contents, digest, hits, report, profile)
+
+  async def consume():
+    while True:
+      file_path = await queue.get()
+      if file_path is None:
+        return
+      known_digest = None
+      try:
+        if cache is not None:
+          if await run_io(cache.is_unchanged, file_path):
+            logging.info(f"Skipped cached file: {file_path}")
+            counts['unchanged'] += 1
+            continue
+          known_digest = cache.digest(file_path)
+        status, digest, text = await convert(file_path, known_digest)
+      except Exception as e:
+        logging.error(f"Error processing file {file_path}: {str(e)}")
+        status, digest, text = 'failed', None, str(e)
+      handle_result(file_path, status, digest, text, counts, cache, report, output)
+
+  io_executor = ThreadPoolExecutor(max_workers=io_concurrency)
+  cpu_executor = executors[executor_type](max_workers=jobs, initializer=init_worker, initargs=(pipeline, report, profile is not None, large_file_size))
+  with io_executor, cpu_executor:
+    await asyncio.gather(produce(), *(consume() for _ in range(consumers)))
+
+  if cache is not None and report is None:
+    cache.save(partial=file_paths is not None)
+  return counts
+
+def is_watched_file(directory_path, file_path, skip_list, skip_dirs, ignore_patterns):
+  # The selection of find_yaml_files, for a single path reported by a watcher
+  relative_path = os.path.relpath(file_path, directory_path)
+  parts = relative_path.split(os.sep)
+  if parts[0] == os.pardir or parts[-1] in skip_list or not parts[-1].endswith(('.yml', '.yaml')):
+    return False
+  for index, part in enumerate(parts[:-1]):
+    if part in skip_dirs or part == '.git' or is_ignored(os.sep.join(parts[:index + 1]), ignore_patterns):
+      return False
+  return not is_ignored(relative_path, ignore_patterns)
 
+# Event flags and layout of struct inotify_event, see inotify(7)
+IN_CLOSE_WRITE, IN_MOVED_TO, IN_CREATE, IN_Q_OVERFLOW, IN_IGNORED, IN_ISDIR = 0x8, 0x80, 0x100, 0x4000, 0x8000, 0x40000000
+inotify_event_header = struct.Struct('iIII')
 
-def process_files_in_parallel(directory_path, skip_list, skip_dirs, fqcn_mapping):
-  with ThreadPoolExecutor() as executor:
-    for root, dirs, files in os.walk(directory_path):
-      # Filter out directories based on the provided skip_dirs argument
-      dirs[:] = [d for d in dirs if d not in skip_dirs]
-      for file_name in files:
-        if file_name in skip_list:
+class InotifyWatcher:
+  # Reports files that are written or moved into the tree, through the
+  # inotify calls libc exposes on Linux. Directories are watched as they
+  # appear, skipping the same ones find_yaml_files skips.
+  settle_time = 0.05
+
+  def __init__(self, directory_path, skip_list, skip_dirs):
+    self.libc = ctypes.CDLL(ctypes.util.find_library('c'), use_errno=True)
+    if not hasattr(self.libc, 'inotify_init1'):
+      raise OSError("inotify is not available on this platform")
+    self.fd = self.libc.inotify_init1(os.O_NONBLOCK | os.O_CLOEXEC)
+    if self.fd < 0:
+      raise OSError(ctypes.get_errno(), "inotify_init1 failed")
+    self.directory_path = directory_path
+    self.skip_dirs = skip_dirs
+    self.ignore_patterns = load_ignore_patterns(directory_path)
+    self.watches = {}
+    try:
+      self.add_tree(directory_path)
+    except OSError:
+      self.close()
+      raise
+
+  def watched_dir(self, dir_path):
+    return os.path.basename(dir_path) not in self.skip_dirs and os.path.basename(dir_path) != '.git' and not is_ignored(os.path.relpath(dir_path, self.directory_path), self.ignore_patterns)
+
+  def add_tree(self, top):
+    # Returns the files already present, which may have been written before
+    # the watch was in place
+    found = []
+    for root, dirs, files in os.walk(top):
+      dirs[:] = [d for d in dirs if self.watched_dir(os.path.join(root, d))]
+      wd = self.libc.inotify_add_watch(self.fd, os.fsencode(root), IN_CLOSE_WRITE | IN_MOVED_TO | IN_CREATE)
+      if wd < 0:
+        error = ctypes.get_errno()
+        raise OSError(error, f"Cannot watch '{root}': {os.strerror(error)}")
+      self.watches[wd] = root
+      found.extend(os.path.join(root, file_name) for file_name in files)
+    return found
+
+  def changes(self, timeout):
+    # Waits up to timeout seconds and returns the paths that changed
+    changed = set()
+    if not select.select([self.fd], [], [], timeout)[0]:
+      return changed
+    # Editors save in several steps, let those settle into one batch
+    time.sleep(self.settle_time)
+    while True:
+      try:
+        data = os.read(self.fd, 65536)
+      except BlockingIOError:
+        return changed
+      offset = 0
+      while offset < len(data):
+        wd, mask, _, length = inotify_event_header.unpack_from(data, offset)
+        name = os.fsdecode(data[offset + inotify_event_header.size:offset + inotify_event_header.size + length].rstrip(b'\0'))
+        offset += inotify_event_header.size + length
+        if mask & IN_Q_OVERFLOW:
+          # Events were dropped, so anything may have changed
+          changed.update(self.add_tree(self.directory_path))
+        elif mask & IN_IGNORED:
+          self.watches.pop(wd, None)
+        elif wd in self.watches and name:
+          path = os.path.join(self.watches[wd], name)
+          if not mask & IN_ISDIR:
+            if mask & (IN_CLOSE_WRITE | IN_MOVED_TO):
+              changed.add(path)
+          elif self.watched_dir(path):
+            changed.update(self.add_tree(path))
+
+  def close(self):
+    os.close(self.fd)
+
+class PollingWatcher:
+  # Fallback where inotify is not available: rescans the tree and compares
+  # modification times and sizes
+  def __init__(self, directory_path, skip_list, skip_dirs):
+    self.directory_path = directory_path
+    self.skip_list = skip_list
+    self.skip_dirs = skip_dirs
+    self.snapshot = self.scan()
+
+  def scan(self):
+    snapshot = {}
+    for file_path in find_yaml_files(self.directory_path, self.skip_list, self.skip_dirs):
+      try:
+        stat = os.stat(file_path)
+      except FileNotFoundError:
+        continue
+      snapshot[file_path] = (stat.st_mtime_ns, stat.st_size)
+    return snapshot
+
+  def changes(self, timeout):
+    time.sleep(timeout)
+    snapshot = self.scan()
+    changed = {file_path for file_path, stamp in snapshot.items() if self.snapshot.get(file_path) != stamp}
+    self.snapshot = snapshot
+    return changed
+
+  def close(self):
+    pass
+
+def watch_files(directory_path, skip_list, skip_dirs, pipeline, report=None, output=None, large_file_size=None, stop=None, interval=0.5, counts=None):
+  # Converts files as they are saved until stop is set or the process is
+  # interrupted. The content hash each file was left with is remembered, so
+  # the watcher's own writes and saves that change nothing are skipped.
+  try:
+    watcher = InotifyWatcher(directory_path, skip_list, skip_dirs)
+  except OSError as e:
+    logging.info(f"Polling for changes, inotify is not usable: {str(e)}")
+    watcher = PollingWatcher(directory_path, skip_list, skip_dirs)
+
+  ignore_patterns = load_ignore_patterns(directory_path)
+  digests = {}
+  output = sys.stdout if output is None else output
+  counts = Counter() if counts is None else counts
+  try:
+    while stop is None or not stop.is_set():
+      for file_path in sorted(watcher.changes(interval)):
+        if not os.path.isfile(file_path) or not is_watched_file(directory_path, file_path, skip_list, skip_dirs, ignore_patterns):
           continue
-        elif file_name.endswith(('.yml', '.yaml')):
-          file_path = os.path.join(root, file_name)
-          executor.submit(process_file, file_path, fqcn_mapping)
+        status, digest, text = process_file(file_path, pipeline, digests.get(file_path), report, large_file_size=large_file_size)
+        handle_result(file_path, status, digest, text, counts, None, report, output)
+        if digest is not None and (report is None or status == 'unchanged'):
+          digests[file_path] = digest
+        if status == 'changed' and report is None:
+          print(f"Converted {file_path}", file=sys.stderr)
+  finally:
+    watcher.close()
+  return counts
 
-def main():
-  parser = argparse.ArgumentParser(description="YAML file processing script")
+class ConversionServer:
+  # Answers JSON-RPC 2.0 requests, one JSON object per line, with a pipeline
+  # that stays compiled between requests. File requests remember the content
+  # hash each file was left with, so saves that change nothing are skipped.
+  def __init__(self, pipeline, large_file_size=None):
+    self.pipeline = pipeline
+    self.large_file_size = large_file_size
+    self.digests = {}
+    self.stopped = threading.Event()
+    self.methods = {'convert': self.convert, 'convert_file': self.convert_file, 'shutdown': self.shutdown}
+
+  def convert(self, text):
+    hits = Counter()
+    file_contents = self.pipeline.apply(text, hits)
+    return {'text': file_contents, 'changed': file_contents != text, 'hits': dict(hits)}
+
+  def convert_file(self, path, report=None):
+    if report not in (None, 'names', 'diff', 'json'):
+      raise ValueError(f"Unknown report '{report}'")
+    file_path = os.path.abspath(path)
+    status, digest, text = process_file(file_path, self.pipeline, self.digests.get(file_path), report, large_file_size=self.large_file_size)
+    # In check mode a changed file is left as it was, so its hash does not
+    # stand for converted content
+    if digest is not None and (report is None or status == 'unchanged'):
+      self.digests[file_path] = digest
+    if status == 'failed':
+      return {'status': status, 'error': text}
+    return {'status': status, 'report': text}
+
+  def shutdown(self):
+    self.stopped.set()
+    return None
+
+  def handle(self, line):
+    # Returns the response to one request line, or None for a notification
+    try:
+      request = json.loads(line)
+    except ValueError as e:
+      return {'jsonrpc': '2.0', 'id': None, 'error': {'code': -32700, 'message': f"Parse error: {str(e)}"}}
+    if not isinstance(request, dict) or not isinstance(request.get('method'), str):
+      return {'jsonrpc': '2.0', 'id': None, 'error': {'code': -32600, 'message': "Invalid request"}}
+
+    request_id = request.get('id')
+    method = self.methods.get(request['method'])
+    params = request.get('params') or {}
+    if method is None:
+      response = {'error': {'code': -32601, 'message': f"Method not found: {request['method']}"}}
+    elif not isinstance(params, (dict, list)):
+      response = {'error': {'code': -32602, 'message': "Invalid params"}}
+    else:
+      try:
+        response = {'result': method(**params) if isinstance(params, dict) else method(*params)}
+      except (TypeError, ValueError) as e:
+        response = {'error': {'code': -32602, 'message': f"Invalid params: {str(e)}"}}
+    if 'id' not in request:
+      return None
+    return {'jsonrpc': '2.0', 'id': request_id, **response}
+
+  def serve_stream(self, input, output):
+    for line in input:
+      if not line.strip():
+        continue
+      response = self.handle(line)
+      if response is not None:
+        output.write(json.dumps(response) + '\n')
+        output.flush()
+      if self.stopped.is_set():
+        return
+
+  def serve_socket(self, socket_path):
+    # Every connection gets its own thread, the pipeline is shared as it
+    # holds no per call state
+    server = self
+
+    class Handler(socketserver.StreamRequestHandler):
+      def handle(self):
+        output = io.TextIOWrapper(self.wfile, encoding='utf-8', write_through=True)
+        server.serve_stream(io.TextIOWrapper(self.rfile, encoding='utf-8'), output)
+        if server.stopped.is_set():
+          threading.Thread(target=unix_server.shutdown).start()
+
+    # A socket left behind by an earlier server is cleared away, anything else
+    # at the path is refused rather than deleted
+    try:
+      if not S_ISSOCK(os.lstat(socket_path).st_mode):
+        raise FileExistsError(f"{socket_path} exists and is not a socket")
+      os.unlink(socket_path)
+    except FileNotFoundError:
+      pass
+    with socketserver.ThreadingUnixStreamServer(socket_path, Handler) as unix_server:
+      try:
+        unix_server.serve_forever()
+      finally:
+        os.unlink(socket_path)
+
+def build_pipeline(mapping_file, engine):
+  # Returns the pipeline, or None after logging why it could not be built
+  renames = {}
+  if is_mapping_index(mapping_file):
+    try:
+      fqcn_mapping, renames = load_mapping_index(mapping_file)
+    except (MappingError, pickle.UnpicklingError, KeyError) as e:
+      logging.error(f"Could not load mapping index '{mapping_file}': {str(e)}")
+      fqcn_mapping = {}
+  else:
+    fqcn_mapping = load_fqcn_mapping(mapping_file)
+
+  if not fqcn_mapping:
+    logging.error("No valid mapping found. Exiting.")
+    return None
+
+  try:
+    return pipelines[engine](fqcn_mapping, renames=renames)
+  except RuntimeError as e:
+    logging.error(str(e))
+    print(str(e), file=sys.stderr)
+    return None
+
+def compile_mapping_main(argv):
+  parser = argparse.ArgumentParser(prog='convertV3.py compile-mapping', description="Build a validated mapping index that --mapping-file loads without parsing")
+  parser.add_argument('sources', nargs='+', help="'module: prefix' text files, collection directories or meta/runtime.yml files")
+  parser.add_argument('--output', '-o', required=True, help="Index file to write")
+  args = parser.parse_args(argv)
+
+  try:
+    fqcn_mapping, renames = compile_mapping(args.sources)
+  except MappingError as e:
+    print(str(e), file=sys.stderr)
+    return 1
+  if not fqcn_mapping:
+    print("No mapping entries found in the sources", file=sys.stderr)
+    return 1
+
+  write_mapping_index(args.output, fqcn_mapping, renames, args.sources)
+  print(f"Compiled {len(fqcn_mapping)} modules, {len(renames)} renamed by redirects, into {args.output}")
+  return 0
+
+def serve_main(argv):
+  parser = argparse.ArgumentParser(prog='convertV3.py serve', description="Keep the rules and mapping loaded and convert files or buffers on JSON-RPC requests, one JSON object per line")
+  parser.add_argument('--mapping-file', required=True, help="File containing module name to FQCN mappings, or an index built with compile-mapping")
+  parser.add_argument('--engine', choices=sorted(pipelines), default='regex', help="Rewrite with the text rules, or only in the right YAML context with the structure engine (needs PyYAML)")
+  parser.add_argument('--socket', default=None, metavar='PATH', help="Listen on a Unix socket at PATH instead of stdin and stdout")
+  parser.add_argument('--large-file-size', type=int, default=64, metavar='MB', help="Stream files larger than this in chunks to keep memory flat, 0 disables streaming")
+  args = parser.parse_args(argv)
+
+  configure_logging()
+  pipeline = build_pipeline(args.mapping_file, args.engine)
+  if pipeline is None:
+    return 1
+
+  server = ConversionServer(pipeline, args.large_file_size * 1024 * 1024)
+  try:
+    if args.socket:
+      server.serve_socket(args.socket)
+    else:
+      server.serve_stream(sys.stdin, sys.stdout)
+  except FileExistsError as e:
+    logging.error(str(e))
+    print(str(e), file=sys.stderr)
+    return 1
+  except KeyboardInterrupt:
+    pass
+  return 0
+
+def main(argv=None):
+  argv = sys.argv[1:] if argv is None else argv
+  if argv and argv[0] == 'compile-mapping':
+    return compile_mapping_main(argv[1:])
+  if argv and argv[0] == 'serve':
+    return serve_main(argv[1:])
+
+  parser = argparse.ArgumentParser(description="YAML file processing script, run with compile-mapping as the first argument to build a mapping index or with serve to keep a converter running")
   parser.add_argument('--path', required=True, help="Directory path to search for YAML files")
   parser.add_argument('--skip-dirs', nargs='*', default=['.github'], help="List of directories to skip")
   parser.add_argument('--skip-list', nargs='*', default=['requirements.yml'], help="List of files to skip")
-  parser.add_argument('--mapping-file', required=True, help="File containing module name to FQCN mappings")
+  parser.add_argument('--mapping-file', required=True, help="File containing module name to FQCN mappings, or an index built with compile-mapping")
+  parser.add_argument('--git-tracked', action='store_true', help="Only process files tracked in the git index")
+  parser.add_argument('--respect-gitignore', action='store_true', help="List files through git so .gitignore'd files are skipped")
+  parser.add_argument('--changed-since', default=None, metavar='REF', help="Only process files that differ from the given git ref")
+  parser.add_argument('--engine', choices=sorted(pipelines), default='regex', help="Rewrite with the text rules, or only in the right YAML context with the structure engine (needs PyYAML)")
+  parser.add_argument('--jobs', type=int, default=None, help="Number of workers, defaults to the executor's own default")
+  parser.add_argument('--executor', choices=sorted(executors), default='thread', help="Run workers as threads or as separate processes")
+  parser.add_argument('--batch-size', type=int, default=None, help="Number of files handed to a worker at a time, defaults to 32, or to 1 with --check, --diff or --json")
+  parser.add_argument('--large-file-size', type=int, default=64, metavar='MB', help="Stream files larger than this in chunks to keep memory flat, 0 disables streaming")
+  parser.add_argument('--max-in-flight', type=int, default=None, help="Number of batches queued or running at once, defaults to twice the worker count, or with --async-io the number of files, defaults to twice --io-concurrency")
+  parser.add_argument('--async-io', action='store_true', help="List directories and read and write files concurrently, for trees on NFS or other slow filesystems")
+  parser.add_argument('--io-concurrency', type=int, default=32, help="Number of directory listings, reads and writes in flight at once with --async-io")
+  parser.add_argument('--cache', action='store_true', help="Skip files that are unchanged since the previous cached run")
+  parser.add_argument('--cache-file', default=None, help="Cache file location, defaults to .ansible-modernizr-cache.json under --path")
+  parser.add_argument('--check', action='store_true', help="Do not write any files, list the ones that would change as each file finishes and exit 1 if there are any, or 2 if a file failed. Files go to the workers one at a time unless --batch-size is given")
+  parser.add_argument('--diff', action='store_true', help="Like --check but print a unified diff for each file that would change, as each file finishes")
+  parser.add_argument('--json', action='store_true', help="Like --check but print a JSON line with the rule hits for each file that would change, as each file finishes")
+  parser.add_argument('--watch', action='store_true', help="After the first pass keep converting files as they are saved, until interrupted")
+  parser.add_argument('--profile', action='store_true', help="Print time, matches and bytes scanned per rule and the slowest files to stderr")
+  parser.add_argument('--profile-json', default=None, metavar='FILE', help="Also write the full profile, including every file, as JSON to FILE")
 
-  args = parser.parse_args()
+  args = parser.parse_args(argv)
 
   # Configure logging
-  logging.basicConfig(filename='yaml_processing.log', level=logging.INFO, format='%(asctime)s - %(levelname)s: %(message)s')
+  configure_logging()
 
-  # Load FQCN mapping from the specified file
-  fqcn_mapping = load_fqcn_mapping(args.mapping_file)
+  # Compile the rules once and share them between all workers
+  pipeline = build_pipeline(args.mapping_file, args.engine)
+  if pipeline is None:
+    return 1
 
-  if not fqcn_mapping:
-    logging.error("No valid mapping found. Exiting.")
-    return
+  report = None
+  if args.json:
+    report = 'json'
+  elif args.diff:
+    report = 'diff'
+  elif args.check:
+    report = 'names'
+
+  cache = None
+  if args.cache or args.cache_file:
+    cache_file = args.cache_file or os.path.join(args.path, '.ansible-modernizr-cache.json')
+    cache = ConversionCache(cache_file, args.path, pipeline.fingerprint())
+
+  file_paths = None
+  if args.git_tracked or args.respect_gitignore or args.changed_since:
+    try:
+      file_paths = find_git_files(args.path, args.skip_list, args.skip_dirs, args.changed_since, not args.git_tracked)
+    except (OSError, subprocess.CalledProcessError) as e:
+      message = f"Could not list files through git in '{args.path}': {getattr(e, 'stderr', None) or str(e)}".strip()
+      logging.error(message)
+      print(message, file=sys.stderr)
+      return 1
+
+  profile = Profile() if args.profile or args.profile_json else None
 
   # Process files in parallel
-  process_files_in_parallel(args.path, args.skip_list, args.skip_dirs, fqcn_mapping)
+  if args.async_io:
+    counts = asyncio.run(process_files_async(args.path, args.skip_list, args.skip_dirs, pipeline, args.jobs, args.executor, cache, report, file_paths=file_paths, max_in_flight=args.max_in_flight, profile=profile, large_file_size=args.large_file_size * 1024 * 1024, io_concurrency=args.io_concurrency))
+  else:
+    counts = process_files_in_parallel(args.path, args.skip_list, args.skip_dirs, pipeline, args.jobs, args.executor, args.batch_size, cache, report, file_paths=file_paths, max_in_flight=args.max_in_flight, profile=profile, large_file_size=args.large_file_size * 1024 * 1024)
+
+  if profile is not None:
+    print(profile.table(), file=sys.stderr)
+    if args.profile_json:
+      with open(args.profile_json, 'w') as file:
+        json.dump(profile.to_dict(), file, indent=2)
+
+  if args.watch:
+    print(f"Watching '{args.path}' for changes, press Ctrl+C to stop", file=sys.stderr)
+    try:
+      watch_files(args.path, args.skip_list, args.skip_dirs, pipeline, report, large_file_size=args.large_file_size * 1024 * 1024, counts=counts)
+    except KeyboardInterrupt:
+      pass
+
+  if report is None:
+    summary = f"{counts['changed']} files changed, {counts['unchanged']} unchanged, {counts['failed']} failed"
+    logging.info(summary)
+    print(summary)
+    return 1 if counts['failed'] else 0
+
+  # Keep stdout for the reports so it can be piped into other tools
+  summary = f"{counts['changed']} files would change, {counts['unchanged']} unchanged, {counts['failed']} failed"
+  logging.info(summary)
+  print(summary, file=sys.stderr)
+  if counts['failed']:
+    return 2
+  return 1 if counts['changed'] else 0
 
 if __name__ == "__main__":
-  main()
+  sys.exit(main())
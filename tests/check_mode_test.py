@@ -0,0 +1,81 @@
+import unittest
+import contextlib
+import tempfile
+import shutil
+import json
+import sys
+import os
+from io import StringIO
+
+# Add the path to the "scripts" directory to the sys.path
+script_dir = os.path.abspath(os.path.join(os.path.dirname(__file__), '../'))
+sys.path.append(script_dir)
+
+import convertV3  # noqa: E402
+
+class TestCheckMode(unittest.TestCase):
+    def setUp(self):
+        self.directory_path = tempfile.mkdtemp()
+        self.file_path = os.path.join(self.directory_path, 'main.yml')
+        shutil.copy('tests/test.yml', self.file_path)
+        with open(self.file_path, 'r') as input_file:
+            self.input_content = input_file.read()
+        self.pipeline = convertV3.RulePipeline(convertV3.load_fqcn_mapping('fqcn_mapping.txt'))
+
+    def tearDown(self):
+        shutil.rmtree(self.directory_path)
+
+    def test_diff_report_leaves_files_untouched(self):
+        output = StringIO()
+        counts = convertV3.process_files_in_parallel(self.directory_path, [], [], self.pipeline, report='diff', output=output)
+
+        self.assertEqual(counts['changed'], 1)
+        self.assertIn('+      ansible.builtin.debug:\n', output.getvalue())
+        with open(self.file_path, 'r') as input_file:
+            self.assertEqual(input_file.read(), self.input_content)
+
+    def test_json_report_lists_rule_hits(self):
+        output = StringIO()
+        convertV3.process_files_in_parallel(self.directory_path, [], [], self.pipeline, report='json', output=output)
+
+        summary = json.loads(output.getvalue())
+        self.assertEqual(summary['path'], self.file_path)
+        self.assertEqual(summary['hits']['fqcn:debug'], 3)
+        self.assertEqual(summary['hits']['document_start'], 1)
+
+    def test_reports_stream_per_file(self):
+        for index in range(1, 10):
+            shutil.copy('tests/test.yml', os.path.join(self.directory_path, f'play_{index}.yml'))
+        events = []
+
+        class RecordingPipeline(convertV3.RulePipeline):
+            def apply(self, file_contents, hits=None, profile=None, file_path=None):
+                events.append('transform')
+                return super().apply(file_contents, hits, profile, file_path)
+
+        class RecordingOutput(StringIO):
+            def write(self, text):
+                events.append('report')
+                return super().write(text)
+
+        counts = convertV3.process_files_in_parallel(self.directory_path, [], [], RecordingPipeline({'debug': 'ansible.builtin'}), jobs=1, report='names', output=RecordingOutput())
+        self.assertEqual(counts['changed'], 10)
+        # The first report is out long before the last file is transformed
+        self.assertLess(events.index('report'), len(events) - 1 - events[::-1].index('transform'))
+        self.assertLess(events.index('report'), 5)
+
+    def test_reports_follow_a_redirected_stdout(self):
+        mapping_file = os.path.abspath('fqcn_mapping.txt')
+        working_dir = os.getcwd()
+        os.chdir(self.directory_path)
+        try:
+            for extra_args in ([], ['--async-io']):
+                output = StringIO()
+                with contextlib.redirect_stdout(output), contextlib.redirect_stderr(StringIO()):
+                    self.assertEqual(convertV3.main(['--path', self.directory_path, '--mapping-file', mapping_file, '--check'] + extra_args), 1)
+                self.assertEqual(output.getvalue(), self.file_path + '\n', extra_args)
+        finally:
+            os.chdir(working_dir)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,99 @@
+import unittest
+import shutil
+import tempfile
+import stat
+import sys
+import os
+
+# Add the path to the "scripts" directory to the sys.path
+script_dir = os.path.abspath(os.path.join(os.path.dirname(__file__), '../'))
+sys.path.append(script_dir)
+
+import convertV3  # noqa: E402
+
+class TestCompileMapping(unittest.TestCase):
+    def setUp(self):
+        self.temp_dir = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.temp_dir)
+
+    def write(self, relative_path, file_contents):
+        file_path = os.path.join(self.temp_dir, relative_path)
+        os.makedirs(os.path.dirname(file_path), exist_ok=True)
+        with open(file_path, 'w') as file:
+            file.write(file_contents)
+        return file_path
+
+    def test_rejects_unparseable_lines(self):
+        mapping_file = self.write('mapping.txt', "# comment\n\ndebug: ansible.builtin\ncopy ansible.builtin\n")
+        with self.assertRaisesRegex(convertV3.MappingError, r'mapping.txt:4'):
+            convertV3.compile_mapping([mapping_file])
+
+    def test_rejects_conflicting_entries(self):
+        first = self.write('first.txt', "debug: ansible.builtin\n")
+        second = self.write('second.txt', "debug: community.general\n")
+        with self.assertRaisesRegex(convertV3.MappingError, r'debug: ansible.builtin.debug'):
+            convertV3.compile_mapping([first, second])
+
+    @unittest.skipIf(convertV3.yaml is None, "PyYAML is not installed")
+    def test_follows_redirect_chains(self):
+        builtin_runtime = self.write('ansible_builtin_runtime.yml', (
+            "plugin_routing:\n"
+            "  modules:\n"
+            "    docker_container:\n"
+            "      redirect: community.general.docker_container\n"
+            "    docker_image_facts:\n"
+            "      redirect: community.general.docker_image_facts\n"))
+        collection_path = os.path.join(self.temp_dir, 'general')
+        self.write('general/galaxy.yml', "namespace: community\nname: general\n")
+        self.write('general/plugins/modules/nmcli.py', "")
+        self.write('general/meta/runtime.yml', (
+            "plugin_routing:\n"
+            "  modules:\n"
+            "    docker_container:\n"
+            "      redirect: community.docker.docker_container\n"
+            "    docker_image_facts:\n"
+            "      redirect: community.docker.docker_image_info\n"))
+        mapping_file = self.write('mapping.txt', "debug: ansible.builtin\ndocker_container: community.docker\n")
+
+        fqcn_mapping, renames = convertV3.compile_mapping([builtin_runtime, collection_path, mapping_file])
+        self.assertEqual(fqcn_mapping, {
+            'debug': 'ansible.builtin',
+            'docker_container': 'community.docker',
+            'docker_image_facts': 'community.docker',
+            'nmcli': 'community.general',
+        })
+        self.assertEqual(renames, {'docker_image_facts': 'docker_image_info'})
+
+        pipeline = convertV3.RulePipeline(fqcn_mapping, renames=renames)
+        self.assertEqual(pipeline.apply("- name: Test\n  docker_image_facts:\n    name: foo\n"),
+                         "---\n- name: Test\n  community.docker.docker_image_info:\n    name: foo\n...\n")
+
+    @unittest.skipIf(convertV3.yaml is None, "PyYAML is not installed")
+    def test_rejects_redirect_loops(self):
+        runtime_file = self.write('ansible_collections/acme/tools/meta/runtime.yml', (
+            "plugin_routing:\n"
+            "  modules:\n"
+            "    ping:\n"
+            "      redirect: acme.tools.pong\n"
+            "    pong:\n"
+            "      redirect: acme.tools.ping\n"))
+        mapping_file = self.write('mapping.txt', "ping: acme.tools\n")
+        with self.assertRaisesRegex(convertV3.MappingError, r'Redirect loop'):
+            convertV3.compile_mapping([runtime_file, mapping_file])
+
+    def test_index_round_trip(self):
+        index_file = os.path.join(self.temp_dir, 'mapping.index')
+        self.assertEqual(convertV3.main(['compile-mapping', 'fqcn_mapping.txt', '--output', index_file]), 0)
+        self.assertTrue(convertV3.is_mapping_index(index_file))
+        # A new index is readable like any other file, not the 0600 of mkstemp
+        self.assertEqual(stat.S_IMODE(os.stat(index_file).st_mode), 0o666 & ~convertV3.process_umask)
+        self.assertFalse(convertV3.is_mapping_index('fqcn_mapping.txt'))
+
+        fqcn_mapping, renames = convertV3.load_mapping_index(index_file)
+        self.assertEqual(fqcn_mapping, convertV3.load_fqcn_mapping('fqcn_mapping.txt'))
+        self.assertEqual(renames, {})
+
+if __name__ == '__main__':
+    unittest.main()
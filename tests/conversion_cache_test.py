@@ -0,0 +1,47 @@
+import unittest
+import tempfile
+import shutil
+import stat
+import sys
+import os
+
+# Add the path to the "scripts" directory to the sys.path
+script_dir = os.path.abspath(os.path.join(os.path.dirname(__file__), '../'))
+sys.path.append(script_dir)
+
+import convertV3  # noqa: E402
+
+class TestConversionCache(unittest.TestCase):
+    def setUp(self):
+        self.directory_path = tempfile.mkdtemp()
+        self.cache_file = os.path.join(self.directory_path, '.ansible-modernizr-cache.json')
+        self.file_path = os.path.join(self.directory_path, 'main.yml')
+        shutil.copy('tests/test.yml', self.file_path)
+        self.pipeline = convertV3.RulePipeline(convertV3.load_fqcn_mapping('fqcn_mapping.txt'))
+
+    def tearDown(self):
+        shutil.rmtree(self.directory_path)
+
+    def test_converted_files_are_skipped_on_the_next_run(self):
+        cache = convertV3.ConversionCache(self.cache_file, self.directory_path, self.pipeline.fingerprint())
+        convertV3.process_files_in_parallel(self.directory_path, [], [], self.pipeline, cache=cache)
+
+        self.assertEqual(stat.S_IMODE(os.stat(self.cache_file).st_mode), 0o666 & ~convertV3.process_umask)
+        cache = convertV3.ConversionCache(self.cache_file, self.directory_path, self.pipeline.fingerprint())
+        self.assertTrue(cache.is_unchanged(self.file_path))
+
+        # Touching the file forces a stat mismatch but the content hash still matches
+        os.utime(self.file_path, ns=(0, 0))
+        self.assertFalse(cache.is_unchanged(self.file_path))
+        self.assertEqual(convertV3.process_file(self.file_path, self.pipeline, cache.digest(self.file_path)), ('unchanged', cache.digest(self.file_path), None))
+
+    def test_cache_is_discarded_when_the_rules_change(self):
+        cache = convertV3.ConversionCache(self.cache_file, self.directory_path, self.pipeline.fingerprint())
+        convertV3.process_files_in_parallel(self.directory_path, [], [], self.pipeline, cache=cache)
+
+        other_pipeline = convertV3.RulePipeline({'debug': 'community.general'})
+        cache = convertV3.ConversionCache(self.cache_file, self.directory_path, other_pipeline.fingerprint())
+        self.assertFalse(cache.is_unchanged(self.file_path))
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,111 @@
+import unittest
+import contextlib
+import subprocess
+import json
+import io
+import tempfile
+import shutil
+import sys
+import os
+
+# Add the path to the "scripts" directory to the sys.path
+script_dir = os.path.abspath(os.path.join(os.path.dirname(__file__), '../'))
+sys.path.append(script_dir)
+
+import convertV3  # noqa: E402
+
+class TestDiscovery(unittest.TestCase):
+    def setUp(self):
+        self.directory_path = tempfile.mkdtemp()
+        for relative_path in ['site.yml', 'roles/web/tasks/main.yml', 'vendor/collection/plugin.yml', 'build/out.yaml']:
+            file_path = os.path.join(self.directory_path, relative_path)
+            os.makedirs(os.path.dirname(file_path), exist_ok=True)
+            shutil.copy('tests/test.yml', file_path)
+        with open(os.path.join(self.directory_path, '.ansible-modernizr-ignore'), 'w') as ignore_file:
+            ignore_file.write('# vendored content\nvendor\n')
+
+    def tearDown(self):
+        shutil.rmtree(self.directory_path)
+
+    def relative_paths(self, file_paths):
+        return sorted(os.path.relpath(file_path, self.directory_path) for file_path in file_paths)
+
+    def test_walk_honours_ignore_file(self):
+        file_paths = convertV3.find_yaml_files(self.directory_path, [], [])
+        self.assertEqual(self.relative_paths(file_paths), ['build/out.yaml', 'roles/web/tasks/main.yml', 'site.yml'])
+
+    def test_anchored_and_unsupported_patterns(self):
+        nested_path = os.path.join(self.directory_path, 'roles', 'build', 'main.yml')
+        os.makedirs(os.path.dirname(nested_path))
+        shutil.copy('tests/test.yml', nested_path)
+        with open(os.path.join(self.directory_path, '.ansible-modernizr-ignore'), 'w') as ignore_file:
+            ignore_file.write('/vendor/\n/build\n!site.yml\n**/main.yml\n')
+
+        errors = io.StringIO()
+        with contextlib.redirect_stderr(errors):
+            file_paths = list(convertV3.find_yaml_files(self.directory_path, [], []))
+        self.assertEqual(self.relative_paths(file_paths), ['roles/build/main.yml', 'roles/web/tasks/main.yml', 'site.yml'])
+        self.assertIn("'!site.yml'", errors.getvalue())
+        self.assertIn("'**/main.yml'", errors.getvalue())
+
+    def test_wildcards_do_not_match_a_slash(self):
+        shutil.copy('tests/test.yml', os.path.join(self.directory_path, 'roles', 'site.yml'))
+        with open(os.path.join(self.directory_path, '.ansible-modernizr-ignore'), 'w') as ignore_file:
+            ignore_file.write('roles/*.yml\nvendor/*/plugin.yml\n')
+
+        file_paths = convertV3.find_yaml_files(self.directory_path, [], [])
+        self.assertEqual(self.relative_paths(file_paths), ['build/out.yaml', 'roles/web/tasks/main.yml', 'site.yml'])
+
+    def test_git_discovery_honours_index_and_gitignore(self):
+        def git(*args):
+            subprocess.run(['git', '-C', self.directory_path, '-c', 'user.name=test', '-c', 'user.email=test@example.com', *args], check=True, capture_output=True)
+
+        with open(os.path.join(self.directory_path, '.gitignore'), 'w') as gitignore_file:
+            gitignore_file.write('build/\n')
+        git('init')
+        git('add', 'roles', 'vendor')
+        git('commit', '-m', 'initial')
+
+        tracked = convertV3.find_git_files(self.directory_path, [], [], include_untracked=False)
+        self.assertEqual(self.relative_paths(tracked), ['roles/web/tasks/main.yml'])
+
+        not_ignored = convertV3.find_git_files(self.directory_path, [], [])
+        self.assertEqual(self.relative_paths(not_ignored), ['roles/web/tasks/main.yml', 'site.yml'])
+
+        with open(os.path.join(self.directory_path, 'roles/web/tasks/main.yml'), 'a') as task_file:
+            task_file.write('# changed\n')
+        changed = convertV3.find_git_files(self.directory_path, [], [], changed_since='HEAD', include_untracked=False)
+        self.assertEqual(self.relative_paths(changed), ['roles/web/tasks/main.yml'])
+
+    def test_git_subset_run_keeps_cache_of_other_files(self):
+        def git(*args):
+            subprocess.run(['git', '-C', self.directory_path, '-c', 'user.name=test', '-c', 'user.email=test@example.com', *args], check=True, capture_output=True)
+
+        def cached_files():
+            with open(os.path.join(self.directory_path, '.ansible-modernizr-cache.json'), 'r') as cache_file:
+                return sorted(json.load(cache_file)['files'])
+
+        def run(*args):
+            with contextlib.redirect_stdout(io.StringIO()):
+                return convertV3.main(['--path', self.directory_path, '--mapping-file', mapping_file, '--cache', *args])
+
+        mapping_file = os.path.abspath('fqcn_mapping.txt')
+        git('init')
+        git('add', '.')
+        git('commit', '-m', 'initial')
+        current_dir = os.getcwd()
+        os.chdir(self.directory_path)
+        try:
+            self.assertEqual(run(), 0)
+            self.assertEqual(cached_files(), ['build/out.yaml', 'roles/web/tasks/main.yml', 'site.yml'])
+
+            git('commit', '-a', '-m', 'converted')
+            with open(os.path.join(self.directory_path, 'site.yml'), 'a') as site_file:
+                site_file.write('- import_playbook: other.yml\n')
+            self.assertEqual(run('--changed-since', 'HEAD', '--git-tracked'), 0)
+        finally:
+            os.chdir(current_dir)
+        self.assertEqual(cached_files(), ['build/out.yaml', 'roles/web/tasks/main.yml', 'site.yml'])
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,56 @@
+import unittest
+import random
+import shutil
+import tempfile
+import sys
+import os
+
+# Add the path to the "scripts" directory to the sys.path
+script_dir = os.path.abspath(os.path.join(os.path.dirname(__file__), '../'))
+sys.path.append(script_dir)
+
+import convertV3  # noqa: E402
+
+def random_blocks(file_contents, seed):
+    rng = random.Random(seed)
+    index = 0
+    while index < len(file_contents):
+        size = rng.randint(1, 64)
+        yield file_contents[index:index + size]
+        index += size
+
+class TestLargeFile(unittest.TestCase):
+    def setUp(self):
+        self.pipeline = convertV3.RulePipeline(convertV3.load_fqcn_mapping('fqcn_mapping.txt'))
+        with open('tests/test.yml', 'r') as input_file:
+            self.input_content = input_file.read()
+        self.temp_dir = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.temp_dir)
+
+    def test_chunks_match_apply(self):
+        samples = [self.input_content, self.input_content * 3, '---\nfoo:\n\n\n\n', 'debug:', '\n\n  \n', '...\n\n']
+        for file_contents in samples:
+            for seed in range(20):
+                self.assertEqual(''.join(self.pipeline.apply_chunks(random_blocks(file_contents, seed))), self.pipeline.apply(file_contents))
+
+    def test_large_file_matches_normal_path(self):
+        file_path = os.path.join(self.temp_dir, 'big.yml')
+        with open(file_path, 'w') as file:
+            file.write(self.input_content * 50)
+
+        status, digest, _ = convertV3.process_file(file_path, self.pipeline, large_file_size=1024)
+        self.assertEqual(status, 'changed')
+        with open(file_path, 'r') as file:
+            file_contents = file.read()
+        self.assertEqual(file_contents, self.pipeline.apply(self.input_content * 50))
+        self.assertEqual(digest, convertV3.content_digest(file_contents))
+
+        # A second run finds nothing to do and leaves no temporary file behind
+        status, _, _ = convertV3.process_file(file_path, self.pipeline, large_file_size=1024)
+        self.assertEqual(status, 'unchanged')
+        self.assertEqual(os.listdir(self.temp_dir), ['big.yml'])
+
+if __name__ == '__main__':
+    unittest.main()
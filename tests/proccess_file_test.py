@@ -29,7 +29,7 @@ class TestProcessFile(unittest.TestCase):
           return fqcn_mapping
         fqcn_mapping = load_fqcn_mapping()
         # Call the process_file function on the temporary file
-        convertV3.process_file('tests/temp_test_file.yml', fqcn_mapping)
+        convertV3.process_file('tests/temp_test_file.yml', convertV3.RulePipeline(fqcn_mapping))
 
         # Read the modified file's content
         with open('tests/temp_test_file.yml', 'r') as temp_file:
@@ -48,5 +48,20 @@ class TestProcessFile(unittest.TestCase):
         # Clean up the temporary file (optional)
         os.remove('tests/temp_test_file.yml')
 
+    def test_process_file_skips_writing_converted_file(self):
+        # Start from already converted content so no rule has anything to change
+        with open('tests/test_result.txt', 'r') as expected_file:
+            expected_content = expected_file.read()
+        with open('tests/temp_converted_file.yml', 'w') as temp_file:
+            temp_file.write(expected_content)
+        os.utime('tests/temp_converted_file.yml', ns=(0, 0))
+
+        pipeline = convertV3.RulePipeline(convertV3.load_fqcn_mapping('fqcn_mapping.txt'))
+        status, _, _ = convertV3.process_file('tests/temp_converted_file.yml', pipeline)
+
+        self.assertEqual(status, 'unchanged')
+        self.assertEqual(os.stat('tests/temp_converted_file.yml').st_mtime_ns, 0)
+        os.remove('tests/temp_converted_file.yml')
+
 if __name__ == '__main__':
     unittest.main()
@@ -0,0 +1,80 @@
+import unittest
+import contextlib
+import asyncio
+import tempfile
+import shutil
+import sys
+import os
+from io import StringIO
+
+# Add the path to the "scripts" and "benchmarks" directories to the sys.path
+script_dir = os.path.abspath(os.path.join(os.path.dirname(__file__), '../'))
+sys.path.append(script_dir)
+sys.path.append(os.path.join(script_dir, 'benchmarks'))
+
+import convertV3  # noqa: E402
+from latency_fs import LatencyFilesystem  # noqa: E402
+
+class TestProcessFilesAsync(unittest.TestCase):
+    def setUp(self):
+        self.directory_path = tempfile.mkdtemp()
+        for relative_dir in ('', 'roles/web/tasks', 'roles/db/tasks', 'skipped', 'vendor'):
+            os.makedirs(os.path.join(self.directory_path, relative_dir), exist_ok=True)
+            for index in range(3):
+                shutil.copy('tests/test.yml', os.path.join(self.directory_path, relative_dir, f'play_{index}.yml'))
+        with open(os.path.join(self.directory_path, '.ansible-modernizr-ignore'), 'w') as ignore_file:
+            ignore_file.write("vendor\n")
+        # Not valid UTF-8, so reading it fails
+        with open(os.path.join(self.directory_path, 'broken.yml'), 'wb') as broken_file:
+            broken_file.write(b'\xff\xfe')
+        self.pipeline = convertV3.RulePipeline(convertV3.load_fqcn_mapping('fqcn_mapping.txt'))
+
+    def tearDown(self):
+        shutil.rmtree(self.directory_path)
+
+    def test_converts_like_the_thread_pool_on_a_slow_filesystem(self):
+        errors = StringIO()
+        with contextlib.redirect_stderr(errors), LatencyFilesystem(0.002) as filesystem:
+            counts = asyncio.run(convertV3.process_files_async(self.directory_path, ['play_2.yml'], ['skipped'], self.pipeline, jobs=2, io_concurrency=8, max_in_flight=4))
+
+        self.assertEqual(counts['changed'], 6)
+        self.assertEqual(counts['failed'], 1)
+        self.assertIn('broken.yml', errors.getvalue())
+        self.assertGreater(filesystem.max_concurrent, 1)
+        with open('tests/test_result.txt', 'r') as expected_file:
+            expected_content = expected_file.read()
+        with open('tests/test.yml', 'r') as input_file:
+            input_content = input_file.read()
+        for relative_path, file_contents in (('roles/db/tasks/play_1.yml', expected_content), ('play_0.yml', expected_content),
+                                             ('play_2.yml', input_content), ('skipped/play_0.yml', input_content), ('vendor/play_0.yml', input_content)):
+            with open(os.path.join(self.directory_path, relative_path), 'r') as output_file:
+                self.assertEqual(output_file.read(), file_contents, relative_path)
+
+    def test_check_mode_reports_match(self):
+        expected = StringIO()
+        actual = StringIO()
+        with contextlib.redirect_stderr(StringIO()):
+            convertV3.process_files_in_parallel(self.directory_path, [], [], self.pipeline, report='json', output=expected)
+            counts = asyncio.run(convertV3.process_files_async(self.directory_path, [], [], self.pipeline, report='json', output=actual))
+
+        self.assertEqual(counts['changed'], 12)
+        self.assertEqual(sorted(actual.getvalue().splitlines()), sorted(expected.getvalue().splitlines()))
+
+    def test_profile_records_every_stage_per_file(self):
+        file_paths = [os.path.join(self.directory_path, f'play_{index}.yml') for index in range(3)]
+        profile = convertV3.Profile()
+        asyncio.run(convertV3.process_files_async(self.directory_path, [], [], self.pipeline, file_paths=file_paths, profile=profile))
+        for file_path in file_paths:
+            self.assertEqual(sorted(profile.files[file_path]), ['read', 'transform', 'write'])
+        self.assertEqual(profile.skipped, {file_path: 0 for file_path in file_paths})
+
+        # Streamed files overlap, yet their passes skipped are still counted per file
+        file_paths = [os.path.join(self.directory_path, 'roles/web/tasks', f'play_{index}.yml') for index in range(3)]
+        profile = convertV3.Profile()
+        asyncio.run(convertV3.process_files_async(self.directory_path, [], [], self.pipeline, file_paths=file_paths, profile=profile, large_file_size=1))
+        self.assertEqual(sorted(profile.files[file_paths[0]]), ['stream'])
+        self.assertEqual(len(profile.skipped), 3)
+        self.assertEqual(len(set(profile.skipped.values())), 1)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,93 @@
+import unittest
+import contextlib
+import multiprocessing
+import functools
+import tempfile
+import shutil
+import sys
+import os
+from io import StringIO
+from concurrent.futures import ProcessPoolExecutor
+
+# Add the path to the "scripts" directory to the sys.path
+script_dir = os.path.abspath(os.path.join(os.path.dirname(__file__), '../'))
+sys.path.append(script_dir)
+
+import convertV3  # noqa: E402
+
+class CrashingPipeline(convertV3.RulePipeline):
+    # Kills the worker process on a file asking for it
+    def apply(self, file_contents, hits=None, profile=None, file_path=None):
+        if file_contents.startswith('# crash'):
+            os._exit(1)
+        return super().apply(file_contents, hits, profile, file_path)
+
+class TestProcessFilesInParallel(unittest.TestCase):
+    def setUp(self):
+        self.directory_path = tempfile.mkdtemp()
+        for index in range(5):
+            shutil.copy('tests/test.yml', os.path.join(self.directory_path, f'play_{index}.yml'))
+        # Not valid UTF-8, so reading it fails
+        with open(os.path.join(self.directory_path, 'broken.yml'), 'wb') as broken_file:
+            broken_file.write(b'\xff\xfe')
+        self.pipeline = convertV3.RulePipeline(convertV3.load_fqcn_mapping('fqcn_mapping.txt'))
+
+    def tearDown(self):
+        shutil.rmtree(self.directory_path)
+
+    def test_failures_are_counted_and_reported(self):
+        errors = StringIO()
+        with contextlib.redirect_stderr(errors):
+            counts = convertV3.process_files_in_parallel(self.directory_path, [], [], self.pipeline, jobs=2, batch_size=1, max_in_flight=1)
+
+        self.assertEqual(counts['changed'], 5)
+        self.assertEqual(counts['failed'], 1)
+        self.assertIn('broken.yml', errors.getvalue())
+        with open(os.path.join(self.directory_path, 'play_4.yml'), 'r') as output_file, open('tests/test_result.txt', 'r') as expected_file:
+            self.assertEqual(output_file.read(), expected_file.read())
+
+    def test_process_pool_matches_expected_result(self):
+        with open('tests/test_result.txt', 'r') as expected_file:
+            expected_content = expected_file.read()
+        # Spawned workers get the pipeline pickled through init_worker and set
+        # up their own logging, which writes to the working directory
+        executor_class = convertV3.executors['process']
+        convertV3.executors['process'] = functools.partial(ProcessPoolExecutor, mp_context=multiprocessing.get_context('spawn'))
+        working_dir = os.getcwd()
+        os.chdir(self.directory_path)
+        try:
+            with contextlib.redirect_stderr(StringIO()):
+                counts = convertV3.process_files_in_parallel(self.directory_path, [], [], self.pipeline, jobs=2, executor_type='process', batch_size=2)
+        finally:
+            os.chdir(working_dir)
+            convertV3.executors['process'] = executor_class
+
+        self.assertEqual(counts['changed'], 5)
+        self.assertEqual(counts['failed'], 1)
+        for index in range(5):
+            with open(os.path.join(self.directory_path, f'play_{index}.yml'), 'r') as output_file:
+                self.assertEqual(output_file.read(), expected_content)
+        with open(os.path.join(self.directory_path, 'yaml_processing.log'), 'r') as log_file:
+            self.assertIn('Processed file:', log_file.read())
+
+    def test_dead_worker_fails_its_batch_and_the_run_goes_on(self):
+        with open(os.path.join(self.directory_path, 'crash.yml'), 'w') as crash_file:
+            crash_file.write("# crash\n")
+        pipeline = CrashingPipeline(convertV3.load_fqcn_mapping('fqcn_mapping.txt'))
+        errors = StringIO()
+        # Workers set up logging of their own when the test process has none,
+        # which writes to the working directory
+        working_dir = os.getcwd()
+        os.chdir(self.directory_path)
+        try:
+            with contextlib.redirect_stderr(errors):
+                counts = convertV3.process_files_in_parallel(self.directory_path, [], [], pipeline, jobs=2, executor_type='process', batch_size=1, max_in_flight=1)
+        finally:
+            os.chdir(working_dir)
+
+        self.assertEqual(counts['changed'], 5)
+        self.assertEqual(counts['failed'], 2)
+        self.assertIn('crash.yml', errors.getvalue())
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,24 @@
+import unittest
+import sys
+import os
+
+# Add the path to the "scripts" directory to the sys.path
+script_dir = os.path.abspath(os.path.join(os.path.dirname(__file__), '../'))
+sys.path.append(script_dir)
+
+import convertV3  # noqa: E402
+
+class TestReplaceFqcnModules(unittest.TestCase):
+    def test_replaces_mapped_modules_in_one_pass(self):
+        fqcn_mapping = {'debug': 'ansible.builtin', 'nmcli': 'community.general'}
+        file_contents = "    - debug:\n        msg: hi\n    - nmcli:\n        conn_name: eth0\n"
+        expected_content = "    - ansible.builtin.debug:\n        msg: hi\n    - community.general.nmcli:\n        conn_name: eth0\n"
+        self.assertEqual(convertV3.replace_fqcn_modules(file_contents, fqcn_mapping), expected_content)
+
+    def test_skips_fully_qualified_and_unmapped_keys(self):
+        fqcn_mapping = {'copy': 'ansible.builtin'}
+        file_contents = "    - ansible.builtin.copy:\n        src: a\n    - unknown:\n        dest: b\n"
+        self.assertEqual(convertV3.replace_fqcn_modules(file_contents, fqcn_mapping), file_contents)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,81 @@
+import unittest
+import pickle
+import tempfile
+import sys
+import os
+
+# Add the path to the "scripts" directory to the sys.path
+script_dir = os.path.abspath(os.path.join(os.path.dirname(__file__), '../'))
+sys.path.append(script_dir)
+
+import convertV3  # noqa: E402
+
+class TestRulePipeline(unittest.TestCase):
+    def test_apply_matches_expected_result(self):
+        with open('tests/test.yml', 'r') as input_file:
+            input_content = input_file.read()
+        with open('tests/test_result.txt', 'r') as expected_file:
+            expected_content = expected_file.read()
+
+        pipeline = convertV3.RulePipeline(convertV3.load_fqcn_mapping('fqcn_mapping.txt'))
+        self.maxDiff = None
+        self.assertEqual(pipeline.apply(input_content), expected_content)
+
+    def test_pipeline_survives_pickling(self):
+        pipeline = convertV3.RulePipeline({'debug': 'ansible.builtin'})
+        restored = pickle.loads(pickle.dumps(pipeline))
+        file_contents = "- name: test\n  debug:\n    msg: \"{{test}}\"\n"
+        self.assertEqual(restored.apply(file_contents), pipeline.apply(file_contents))
+
+    def test_profile_records_every_rule(self):
+        pipeline = convertV3.RulePipeline({'debug': 'ansible.builtin'})
+        profile = convertV3.Profile()
+        file_contents = "- name: test\n  debug:\n    msg: \"{{test}}\"\n"
+        self.assertEqual(pipeline.apply(file_contents, profile=profile), pipeline.apply(file_contents))
+
+        self.assertEqual(set(profile.rules), {name for name, _, _ in convertV3.patterns_and_replacements} | {'fqcn'})
+        self.assertEqual(profile.rules['fqcn'][1], 1)
+        self.assertEqual(profile.rules['name_capitalize'][1], 1)
+        self.assertEqual(profile.modules['fqcn:debug'], 1)
+
+    def test_profile_counts_bytes_scanned(self):
+        pipeline = convertV3.RulePipeline({'debug': 'ansible.builtin'}, prefilter=False)
+        profile = convertV3.Profile()
+        file_contents = "- name: café\n  debug:\n    msg: ünïcode\n"
+        pipeline.apply(file_contents, profile=profile)
+
+        self.assertEqual(profile.rules['jinja_open'][2], len(file_contents.encode('utf-8')))
+        self.assertNotEqual(profile.rules['jinja_open'][2], len(file_contents))
+
+    def test_prefilter_skips_passes_that_cannot_match(self):
+        pipeline = convertV3.RulePipeline({'debug': 'ansible.builtin'})
+        unfiltered = convertV3.RulePipeline({'debug': 'ansible.builtin'}, prefilter=False)
+        profile = convertV3.Profile()
+        file_contents = "app_port: 8080\napp_users:\n  - alice\n"
+        self.assertEqual(pipeline.apply(file_contents, profile=profile), unfiltered.apply(file_contents))
+
+        skipped = {name for name, totals in profile.rules.items() if totals[3]}
+        self.assertEqual(skipped, {'jinja_open', 'jinja_close', 'jinja_filter', 'comment_space', 'name_capitalize', 'fqcn'})
+        self.assertEqual(profile.passes_skipped, 6)
+
+    def test_prefilter_sees_keys_uncovered_by_rules(self):
+        pipeline = convertV3.RulePipeline({'debug': 'ansible.builtin'})
+        unfiltered = convertV3.RulePipeline({'debug': 'ansible.builtin'}, prefilter=False)
+        for file_contents in ("- name: test\n  #debug:\n", "- name: test\n  {debug:\n", "a: b\n"):
+            self.assertEqual(pipeline.apply(file_contents), unfiltered.apply(file_contents))
+
+    def test_profile_records_skipped_passes_per_file(self):
+        pipeline = convertV3.RulePipeline({'debug': 'ansible.builtin'})
+        profile = convertV3.Profile()
+        with tempfile.TemporaryDirectory() as directory_path:
+            plain_path = os.path.join(directory_path, 'vars.yml')
+            with open(plain_path, 'w') as plain_file:
+                plain_file.write("app_port: 8080\n")
+            convertV3.process_file(plain_path, pipeline, profile=profile)
+            convertV3.process_file('tests/test.yml', pipeline, report='names', profile=profile)
+
+        self.assertEqual(profile.skipped, {plain_path: 6, 'tests/test.yml': 0})
+        self.assertEqual(profile.to_dict()['skipped_passes'], profile.skipped)
+
+if __name__ == '__main__':
+    unittest.main()
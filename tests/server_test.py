@@ -0,0 +1,126 @@
+import unittest
+import io
+import json
+import socket
+import shutil
+import tempfile
+import threading
+import time
+import sys
+import os
+
+# Add the path to the "scripts" directory to the sys.path
+script_dir = os.path.abspath(os.path.join(os.path.dirname(__file__), '../'))
+sys.path.append(script_dir)
+
+import convertV3  # noqa: E402
+
+class TestConversionServer(unittest.TestCase):
+    def setUp(self):
+        self.temp_dir = tempfile.mkdtemp()
+        self.pipeline = convertV3.RulePipeline({'debug': 'ansible.builtin'})
+        self.server = convertV3.ConversionServer(self.pipeline)
+
+    def tearDown(self):
+        shutil.rmtree(self.temp_dir)
+
+    def request(self, request_id, method, params=None):
+        return json.dumps({'jsonrpc': '2.0', 'id': request_id, 'method': method, 'params': params or {}}) + '\n'
+
+    def test_convert_and_errors(self):
+        file_contents = "- name: test\n  debug:\n"
+        requests = [
+            self.request(1, 'convert', {'text': file_contents}),
+            self.request(2, 'missing'),
+            self.request(3, 'convert', {'buffer': file_contents}),
+            'not json\n',
+            json.dumps({'jsonrpc': '2.0', 'method': 'convert', 'params': {'text': ''}}) + '\n',
+            self.request(4, 'shutdown'),
+            self.request(5, 'convert', {'text': file_contents}),
+        ]
+        output = io.StringIO()
+        self.server.serve_stream(io.StringIO(''.join(requests)), output)
+        responses = [json.loads(line) for line in output.getvalue().splitlines()]
+
+        self.assertEqual([response['id'] for response in responses], [1, 2, 3, None, 4])
+        self.assertEqual(responses[0]['result']['text'], self.pipeline.apply(file_contents))
+        self.assertTrue(responses[0]['result']['changed'])
+        self.assertEqual(responses[0]['result']['hits']['fqcn:debug'], 1)
+        self.assertEqual([response['error']['code'] for response in responses[1:4]], [-32601, -32602, -32700])
+
+    def test_convert_file_over_socket(self):
+        file_path = os.path.join(self.temp_dir, 'playbook.yml')
+        with open(file_path, 'w') as file:
+            file.write("- name: test\n  debug:\n")
+        socket_path = os.path.join(self.temp_dir, 'modernizr.sock')
+        thread = threading.Thread(target=self.server.serve_socket, args=(socket_path,))
+        thread.start()
+        try:
+            for _ in range(100):
+                if os.path.exists(socket_path):
+                    break
+                time.sleep(0.01)
+            with socket.socket(socket.AF_UNIX) as client:
+                client.connect(socket_path)
+                reader = client.makefile('r')
+                client.sendall(self.request(1, 'convert_file', {'path': file_path, 'report': 'names'}).encode())
+                self.assertEqual(json.loads(reader.readline())['result'], {'status': 'changed', 'report': file_path + '\n'})
+                client.sendall(self.request(2, 'convert_file', {'path': file_path}).encode())
+                self.assertEqual(json.loads(reader.readline())['result'], {'status': 'changed', 'report': None})
+                client.sendall(self.request(3, 'convert_file', {'path': file_path}).encode())
+                self.assertEqual(json.loads(reader.readline())['result']['status'], 'unchanged')
+                client.sendall(self.request(4, 'shutdown').encode())
+                reader.readline()
+        finally:
+            self.server.stopped.set()
+            thread.join(5)
+        self.assertFalse(thread.is_alive())
+        self.assertFalse(os.path.exists(socket_path))
+
+    def test_socket_path_that_is_not_a_socket_is_kept(self):
+        file_path = os.path.join(self.temp_dir, 'notes.txt')
+        with open(file_path, 'w') as file:
+            file.write("keep me\n")
+        with self.assertRaises(FileExistsError):
+            self.server.serve_socket(file_path)
+        with open(file_path, 'r') as file:
+            self.assertEqual(file.read(), "keep me\n")
+
+class TestWatchFiles(unittest.TestCase):
+    def setUp(self):
+        self.temp_dir = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.temp_dir)
+
+    def test_converts_saved_files(self):
+        pipeline = convertV3.RulePipeline({'debug': 'ansible.builtin'})
+        stop = threading.Event()
+        counts = convertV3.Counter()
+        thread = threading.Thread(target=convertV3.watch_files, args=(self.temp_dir, [], ['skipped'], pipeline), kwargs={'stop': stop, 'interval': 0.05, 'counts': counts})
+        thread.start()
+        try:
+            time.sleep(0.2)
+            os.makedirs(os.path.join(self.temp_dir, 'roles', 'web'))
+            os.makedirs(os.path.join(self.temp_dir, 'skipped'))
+            for relative_path in ('roles/web/main.yml', 'skipped/main.yml', 'notes.txt'):
+                with open(os.path.join(self.temp_dir, relative_path), 'w') as file:
+                    file.write("- name: test\n  debug:\n")
+            for _ in range(100):
+                if counts['changed']:
+                    break
+                time.sleep(0.05)
+            time.sleep(0.3)
+        finally:
+            stop.set()
+            thread.join(5)
+
+        with open(os.path.join(self.temp_dir, 'roles', 'web', 'main.yml'), 'r') as file:
+            self.assertEqual(file.read(), "---\n- name: Test\n  ansible.builtin.debug:\n...\n")
+        with open(os.path.join(self.temp_dir, 'skipped', 'main.yml'), 'r') as file:
+            self.assertEqual(file.read(), "- name: test\n  debug:\n")
+        self.assertEqual(counts['changed'], 1)
+        self.assertEqual(counts['failed'], 0)
+
+if __name__ == '__main__':
+    unittest.main()
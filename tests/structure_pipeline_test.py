@@ -0,0 +1,76 @@
+import unittest
+import tempfile
+import sys
+import os
+
+# Add the path to the "scripts" directory to the sys.path
+script_dir = os.path.abspath(os.path.join(os.path.dirname(__file__), '../'))
+sys.path.append(script_dir)
+
+import convertV3  # noqa: E402
+
+@unittest.skipIf(convertV3.yaml is None, "PyYAML is not installed")
+class TestStructurePipeline(unittest.TestCase):
+    def setUp(self):
+        self.pipeline = convertV3.StructurePipeline(convertV3.load_fqcn_mapping('fqcn_mapping.txt'))
+
+    def test_rules_only_apply_in_their_context(self):
+        file_contents = (
+            "- hosts: all\n"
+            "  vars:\n"
+            "    users:\n"
+            "      - name: bob\n"
+            "  tasks:\n"
+            "    #see https://example.com/docs#section\n"
+            "    - name: add user\n"
+            "      user:\n"
+            "        name: james\n"
+            "        shell: /bin/bash\n"
+            "    - name: run script\n"
+            "      shell: |\n"
+            "        echo {{x}}\n"
+            "\n"
+            "\n"
+            "        echo done\n"
+            "      when: \"{{a|bool}}\"\n"
+        )
+        expected_content = (
+            "---\n"
+            "- hosts: all\n"
+            "  vars:\n"
+            "    users:\n"
+            "      - name: bob\n"
+            "  tasks:\n"
+            "    # see https://example.com/docs#section\n"
+            "    - name: Add user\n"
+            "      ansible.builtin.user:\n"
+            "        name: james\n"
+            "        shell: /bin/bash\n"
+            "    - name: Run script\n"
+            "      ansible.builtin.shell: |\n"
+            "        echo {{x}}\n"
+            "\n"
+            "\n"
+            "        echo done\n"
+            "      when: \"{{ a | bool }}\"\n"
+            "...\n"
+        )
+        self.maxDiff = None
+        self.assertEqual(self.pipeline.apply(file_contents), expected_content)
+
+    def test_invalid_yaml_falls_back_to_the_regex_rules(self):
+        file_contents = "- debug: [unclosed\n  msg: {{x}}\n"
+        with self.assertLogs(level='WARNING'):
+            self.assertEqual(self.pipeline.apply(file_contents), convertV3.RulePipeline(self.pipeline.fqcn_mapping).apply(file_contents))
+
+        # The warning names the file it falls back for
+        with tempfile.TemporaryDirectory() as directory_path:
+            file_path = os.path.join(directory_path, 'broken.yml')
+            with open(file_path, 'w') as file:
+                file.write(file_contents)
+            with self.assertLogs(level='WARNING') as logs:
+                convertV3.process_file(file_path, self.pipeline, report='names')
+        self.assertIn(file_path, logs.output[0])
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,83 @@
+import unittest
+import tempfile
+import shutil
+import stat
+import sys
+import os
+
+# Add the path to the "scripts" directory to the sys.path
+script_dir = os.path.abspath(os.path.join(os.path.dirname(__file__), '../'))
+sys.path.append(script_dir)
+
+import convertV3  # noqa: E402
+
+class TestWriteFileAtomically(unittest.TestCase):
+    def setUp(self):
+        self.directory_path = tempfile.mkdtemp()
+        self.pipeline = convertV3.RulePipeline(convertV3.load_fqcn_mapping('fqcn_mapping.txt'))
+        with open('tests/test.yml', 'r') as input_file:
+            self.input_content = input_file.read()
+        with open('tests/test_result.txt', 'r') as expected_file:
+            self.expected_content = expected_file.read()
+
+    def tearDown(self):
+        shutil.rmtree(self.directory_path)
+
+    def write(self, relative_path, file_contents):
+        file_path = os.path.join(self.directory_path, relative_path)
+        os.makedirs(os.path.dirname(file_path), exist_ok=True)
+        with open(file_path, 'w') as file:
+            file.write(file_contents)
+        return file_path
+
+    def read(self, file_path):
+        with open(file_path, 'r') as file:
+            return file.read()
+
+    def test_symlinked_playbook_converts_its_target(self):
+        target_path = self.write('shared/common.yml', self.input_content)
+        link_path = os.path.join(self.directory_path, 'tree', 'link.yml')
+        os.makedirs(os.path.dirname(link_path))
+        os.symlink(os.path.join('..', 'shared', 'common.yml'), link_path)
+
+        status, _, _ = convertV3.process_file(link_path, self.pipeline)
+        self.assertEqual(status, 'changed')
+        self.assertTrue(os.path.islink(link_path))
+        self.assertEqual(self.read(target_path), self.expected_content)
+        self.assertEqual(sorted(os.listdir(os.path.dirname(target_path))), ['common.yml'])
+
+    def test_symlinked_large_playbook_converts_its_target(self):
+        target_path = self.write('shared/common.yml', self.input_content)
+        link_path = os.path.join(self.directory_path, 'link.yml')
+        os.symlink(target_path, link_path)
+
+        status, _, _ = convertV3.process_file(link_path, self.pipeline, large_file_size=1)
+        self.assertEqual(status, 'changed')
+        self.assertTrue(os.path.islink(link_path))
+        self.assertEqual(self.read(target_path), self.expected_content)
+
+    def test_hard_linked_files_are_skipped(self):
+        file_path = self.write('first.yml', self.input_content)
+        other_path = os.path.join(self.directory_path, 'second.yml')
+        os.link(file_path, other_path)
+
+        status, _, error = convertV3.process_file(file_path, self.pipeline)
+        self.assertEqual(status, 'failed')
+        self.assertIn('hard links', error)
+        self.assertTrue(os.path.samefile(file_path, other_path))
+        self.assertEqual(self.read(file_path), self.input_content)
+        self.assertEqual(sorted(os.listdir(self.directory_path)), ['first.yml', 'second.yml'])
+
+        status, _, _ = convertV3.process_file(file_path, self.pipeline, large_file_size=1)
+        self.assertEqual(status, 'failed')
+        self.assertEqual(self.read(file_path), self.input_content)
+        self.assertEqual(sorted(os.listdir(self.directory_path)), ['first.yml', 'second.yml'])
+
+    def test_mode_carries_over(self):
+        file_path = self.write('play.yml', self.input_content)
+        os.chmod(file_path, 0o640)
+        convertV3.write_file_atomically(file_path, self.expected_content)
+        self.assertEqual(stat.S_IMODE(os.stat(file_path).st_mode), 0o640)
+
+if __name__ == '__main__':
+    unittest.main()